@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+from pastpaper.subjects import LEVELS, SESSIONS
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), "Documents", "past paper")
+KINDS = ["qp", "ms", "in", "er", "gt"]
+
+
+class JobError(ValueError):
+    """The job file doesn't describe a valid selection."""
+
+
+class Shard(NamedTuple):
+    """Part `index` of `count` (from 1) of a job split across runs.
+
+    Session folders are dealt out by a hash of their site path, so every
+    run can work out its share of the plan on its own, and each folder is
+    listed by one run only.
+    """
+    index: int
+    count: int
+
+    def owns(self, folder: str) -> bool:
+        digest = hashlib.sha1(folder.encode()).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index - 1
+
+
+def parse_shard(value) -> Shard | None:
+    """A Shard from "I/N", e.g. "2/4"; None if value is None."""
+    if value is None:
+        return None
+    index, _, count = str(value).partition("/")
+    try:
+        shard = Shard(int(index), int(count))
+    except ValueError:
+        raise JobError(f"invalid shard: {value} (expected I/N, e.g. 2/4)") from None
+    if not 1 <= shard.index <= shard.count:
+        raise JobError(f"invalid shard: {value} (I must be between 1 and N)")
+    return shard
+
+
+def load_job(path: str) -> dict:
+    """Read a JSON job file: either one selection, or {"jobs": [...]} with
+    shared settings (out_dir, workers, revalidate, no_cache, shard) at the
+    top level.
+    """
+    with open(path, "r") as f:
+        try:
+            job = json.load(f)
+        except ValueError as e:
+            raise JobError(f"{path}: {e}") from None
+    if not isinstance(job, dict):
+        raise JobError(f"{path}: expected a JSON object")
+    return job
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, (str, int)):
+        return [value]
+    return list(value)
+
+
+def expand_subjects(values) -> List[Tuple[str, str, str]]:
+    """(name, code, slug) for each subject name, code or site folder, from
+    the subject catalog; "all" means every subject the catalog lists.
+    """
+    from pastpaper.catalog import get_catalog
+
+    catalog = get_catalog()
+    found = []
+    for value in _as_list(values):
+        value = str(value).strip().lower()
+        if value == "all":
+            matches = [tuple(subject) for subject in catalog.subjects()]
+        else:
+            subject = catalog.find(value)
+            matches = [tuple(subject)] if subject else []
+        if not matches:
+            raise JobError(f"unknown subject: {value}")
+        found += [entry for entry in matches if entry not in found]
+    if not found:
+        raise JobError("no subjects selected")
+    return found
+
+
+def expand_levels(values) -> List[str]:
+    """Level folder slugs for "as", "a" and "both" (default), deduplicated."""
+    names = {name: slug for name, slug in LEVELS.values()}
+    slugs = []
+    for value in _as_list(values) or ["both"]:
+        value = str(value).strip().lower()
+        if value not in names:
+            raise JobError(f"unknown level: {value}")
+        if names[value] not in slugs:
+            slugs.append(names[value])
+    return slugs
+
+
+def expand_kinds(values) -> List[str]:
+    kinds = []
+    for value in _as_list(values) or ["qp", "ms"]:
+        value = str(value).strip().lower()
+        expanded = KINDS if value == "all" else ["qp", "ms"] if value == "both" else [value]
+        for kind in expanded:
+            if kind not in KINDS:
+                raise JobError(f"unknown paper kind: {kind}")
+            if kind not in kinds:
+                kinds.append(kind)
+    return kinds
+
+
+def expand_sessions(values) -> List[Tuple[str, str]]:
+    """(code, folder name) per session, by name ("may-june") or code ("s")."""
+    found = []
+    for value in _as_list(values) or ["all"]:
+        value = str(value).strip().lower()
+        matches = [
+            (code, slug)
+            for name, code, slug in SESSIONS.values()
+            if value in ("all", name, code)
+        ]
+        if not matches:
+            raise JobError(f"unknown session: {value}")
+        found += [match for match in matches if match not in found]
+    return found
+
+
+def expand_years(values) -> List[str]:
+    """Two-digit years from "2019-2024", "19-24", 2023 or "23"."""
+    years = []
+    for value in _as_list(values):
+        value = str(value).strip()
+        first, _, last = value.partition("-")
+        try:
+            span = range(int(first[-2:]), int((last or first)[-2:]) + 1)
+        except ValueError:
+            raise JobError(f"bad year: {value}") from None
+        years += [f"{year:02d}" for year in span if f"{year:02d}" not in years]
+    if not years:
+        raise JobError("no years selected")
+    return years
+
+
+def subject_dir(root: str, name: str, code: str) -> str:
+    return os.path.join(root, f"{name.replace(' ', '_')}-{code}")
+
+
+def plan_job(job: dict, root: str | None = None) -> List[Tuple[str, str]]:
+    """Expand every selection in the job into one deduplicated task list."""
+    return list(iter_job_tasks(job, root))
+
+
+def iter_job_tasks(job: dict, root: str | None = None) -> Iterator[Tuple[str, str]]:
+    """Lazy plan_job: tasks are yielded as each folder listing arrives.
+    The selections are validated (raising JobError) before this returns.
+    With a "shard" ("I/N"), only the folders of that shard are planned.
+    """
+    root = os.path.expanduser(root or job.get("out_dir") or DEFAULT_ROOT)
+    shard = parse_shard(job.get("shard"))
+    specs = []
+    for spec in job.get("jobs") or [job]:
+        subjects = expand_subjects(spec.get("subjects"))
+        levels = expand_levels(spec.get("levels"))
+        kinds = expand_kinds(spec.get("kinds"))
+        sessions = expand_sessions(spec.get("sessions"))
+        years = expand_years(spec.get("years"))
+        papers = [str(p) for p in _as_list(spec.get("papers"))] or None
+        specs.append((subjects, levels, kinds, sessions, years, papers))
+    return _job_tasks(specs, root, shard)
+
+
+def _job_tasks(specs: list, root: str, shard: Shard | None = None) -> Iterator[Tuple[str, str]]:
+    from pastpaper.scraper import iter_download_tasks
+
+    seen = set()
+    for subjects, levels, kinds, sessions, years, papers in specs:
+        for name, code, slug in subjects:
+            for level_slug in levels:
+                want = None
+                if shard is not None:
+                    def want(session_folder, prefix=f"{level_slug}/{slug}/"):
+                        return shard.owns(prefix + session_folder)
+
+                for url, out_path in iter_download_tasks(
+                    code,
+                    slug,
+                    level_slug,
+                    kinds,
+                    [session[0] for session in sessions],
+                    [session[1] for session in sessions],
+                    years,
+                    papers,
+                    subject_dir(root, name, code),
+                    want_folder=want,
+                ):
+                    if out_path not in seen:
+                        seen.add(out_path)
+                        yield url, out_path
+
+
+def preview_job(job: dict, head: bool = False) -> dict:
+    """Plan the job without downloading or writing anything: the plan
+    summary plus the files that a run would fetch.
+    """
+    from pastpaper.inventory import Inventory
+    from pastpaper.planner import make_plan
+    from pastpaper.scraper import http_session
+    from pastpaper.store import BlobStore
+
+    root = os.path.expanduser(job.get("out_dir") or DEFAULT_ROOT)
+    workers = job.get("workers", 8)
+    with http_session(workers):
+        plan = make_plan(
+            plan_job(job, root),
+            inventory=Inventory(root, BlobStore(root)).scan(),
+            head=head,
+            workers=workers,
+        )
+    preview = plan.summary()
+    preview["files"] = [
+        {"url": url, "path": out_path, "bytes": plan.sizes.get(url)}
+        for url, out_path in plan.to_download
+    ]
+    return preview
+
+
+def run_tasks_headless(
+    tasks: Iterable[Tuple[str, str]],
+    workers: int = 8,
+    revalidate: bool = False,
+    use_negative_cache: bool = True,
+    progress: bool = True,
+    root: str | None = None,
+    on_result=None,
+) -> dict:
+    """Download the tasks through one engine and return a summary dict.
+    Files are kept in the content store under `root` (the download root).
+    `on_result`, if given, is also called with every TaskResult.
+    Request timings are written to metrics.METRICS_DIR at the end of the
+    run and summed up under "timing".
+    """
+    from tqdm import tqdm
+
+    from pastpaper.cache import MetadataStore, NegativeCache
+    from pastpaper.engine import DownloadEngine
+    from pastpaper.events import enable_file_log
+    from pastpaper.inventory import Inventory
+    from pastpaper.metrics import RunMetrics
+    from pastpaper.scraper import http_session
+    from pastpaper.store import BlobStore
+
+    enable_file_log()
+    store = BlobStore(root or DEFAULT_ROOT)
+    engine = DownloadEngine(
+        workers=workers,
+        negative_cache=NegativeCache() if use_negative_cache else None,
+        metadata=MetadataStore(),
+        revalidate=revalidate,
+        store=store,
+        inventory=Inventory(root or DEFAULT_ROOT, store),
+    )
+    statuses = {}
+    failed = []
+    count = 0
+    started = time.time()
+    # tqdm hides itself when stderr isn't a terminal (cron, CI). Tasks may
+    # still be being discovered, so the total isn't known up front.
+    with RunMetrics() as metrics, http_session(workers), tqdm(
+        unit="file", file=sys.stderr, disable=None if progress else True
+    ) as bar:
+        def record(result):
+            nonlocal count
+            count += 1
+            bar.update(1)
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+            if result.status == "FAIL":
+                failed.append({"url": result.url, "path": result.out_path})
+            if on_result is not None:
+                on_result(result)
+
+        engine.run(tasks, on_result=record)
+    report, _ = metrics.write()
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "elapsed": round(time.time() - started, 3),
+        "tasks": count,
+        "statuses": statuses,
+        "failed": failed,
+        "timing": metrics.totals(),
+        "metrics": report,
+    }
+
+
+def run_job(job: dict, workers: int | None = None, progress: bool = True) -> dict:
+    return run_tasks_headless(
+        iter_job_tasks(job),
+        workers=workers or job.get("workers", 8),
+        revalidate=bool(job.get("revalidate", False)),
+        use_negative_cache=not job.get("no_cache", False),
+        progress=progress,
+        root=os.path.expanduser(job.get("out_dir") or DEFAULT_ROOT),
+    )
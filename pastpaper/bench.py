@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from pastpaper.fakeserver import FakeServer, FaultConfig
+
+BENCH_SUBJECT = ("9702", "Physics (9702)")
+BENCH_LEVEL = "A-Level"
+FINISHED = ("success", "skipped", "failed")
+
+# What the launcher imports before it can draw the first menu
+STARTUP_MODULE = "pastpaper.cli"
+# Seconds that import may take (median of the runs)
+STARTUP_BUDGET = 0.1
+# Packages that must not be imported at startup: the HTTP and scraping
+# stack and progress bars load when downloads start
+STARTUP_FORBIDDEN = ("requests", "urllib3", "bs4", "lxml", "tqdm", "pastpaper.scraper")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class LatencyProbe:
+    """Time each task from its first request to its final result, from the
+    event bus. Use as a context manager around the run being measured.
+    """
+
+    def __init__(self):
+        self.started = {}
+        self.latencies = []
+        self.statuses = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, event) -> None:
+        key = (event.url, event.out_path)
+        with self._lock:
+            if event.kind == "started":
+                self.started.setdefault(key, event.ts)
+            elif event.kind in FINISHED:
+                self.statuses[event.status] = self.statuses.get(event.status, 0) + 1
+                self.bytes += event.size or 0
+                start = self.started.pop(key, None)
+                if start is not None:
+                    self.latencies.append(event.ts - start)
+
+    def __enter__(self):
+        from pastpaper.events import bus
+
+        bus.subscribe(self)
+        return self
+
+    def __exit__(self, *exc):
+        from pastpaper.events import bus
+
+        bus.unsubscribe(self)
+
+    def report(self, name: str, elapsed: float, server: FakeServer) -> dict:
+        files = self.statuses.get("SUCCESS", 0)
+        return {
+            "benchmark": name,
+            "files": files,
+            "bytes": self.bytes,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": round(files / elapsed, 2) if elapsed else 0.0,
+            "bytes_per_sec": round(self.bytes / elapsed) if elapsed else 0,
+            "p50": round(percentile(self.latencies, 50), 4),
+            "p99": round(percentile(self.latencies, 99), 4),
+            "statuses": dict(self.statuses),
+            "requests": server.stats["requests"],
+        }
+
+
+def bench_download_with_retry(server: FakeServer, out_dir: str, files: int) -> dict:
+    """One file after another through download_with_retry."""
+    from pastpaper.scraper import build_download_tasks, download_with_retry, http_session
+
+    code, slug = BENCH_SUBJECT
+    with http_session(1):
+        tasks = build_download_tasks(
+            code, slug, BENCH_LEVEL, ["qp", "ms"], ["m", "s", "w"],
+            ["March", "May-June", "Oct-Nov"], [f"{y:02d}" for y in range(10, 25)],
+            None, out_dir,
+        )[:files]
+        server.stats.update(requests=0)
+        with LatencyProbe() as probe:
+            start = time.perf_counter()
+            for url, out_path in tasks:
+                # Without the engine's content store the folder must exist
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                download_with_retry(url, out_path, retries=3, timeout=15)
+            elapsed = time.perf_counter() - start
+    return probe.report("download_with_retry", elapsed, server)
+
+
+def bench_scrape_subject(server: FakeServer, out_dir: str, years: int, workers: int) -> dict:
+    """The whole pipeline: listings, planning, the engine and the store."""
+    from pastpaper.scraper import scrape_subject
+
+    code, _ = BENCH_SUBJECT
+    server.stats.update(requests=0)
+    with LatencyProbe() as probe:
+        start = time.perf_counter()
+        scrape_subject(
+            code,
+            BENCH_LEVEL,
+            "both (qp & ms)",
+            ["m", "s", "w"],
+            [f"{y:02d}" for y in range(24 - years + 1, 25)],
+            os.path.join(out_dir, f"Physics-{code}"),
+            workers=workers,
+            use_negative_cache=False,
+        )
+        elapsed = time.perf_counter() - start
+    return probe.report("scrape_subject", elapsed, server)
+
+
+def bench_startup(budget: float = STARTUP_BUDGET, runs: int = 5) -> dict:
+    """Import the CLI in fresh interpreters with -X importtime. Fails ("ok"
+    false) if the median import takes longer than `budget` seconds or pulls
+    in anything in STARTUP_FORBIDDEN.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_dir, env.get("PYTHONPATH")]))
+    samples = []
+    loaded = set()
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {STARTUP_MODULE}"],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        # import time: self [us] | cumulative | imported package
+        for line in proc.stderr.splitlines():
+            fields = line.partition("import time:")[2].split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2].strip()
+            loaded.add(name)
+            if name == STARTUP_MODULE:
+                samples.append(int(fields[1]) / 1e6)
+    seconds = percentile(samples, 50)
+    forbidden = [
+        package for package in STARTUP_FORBIDDEN
+        if any(name == package or name.startswith(package + ".") for name in loaded)
+    ]
+    return {
+        "benchmark": "startup",
+        "seconds": round(seconds, 4),
+        "budget": budget,
+        "forbidden": forbidden,
+        "ok": seconds <= budget and not forbidden,
+    }
+
+
+def format_startup(report: dict) -> str:
+    line = (
+        f"{report['benchmark']:<20} {report['seconds'] * 1000:>7.1f} ms to import {STARTUP_MODULE} "
+        f"(budget {report['budget'] * 1000:.0f} ms)  {'ok' if report['ok'] else 'FAIL'}"
+    )
+    if report["forbidden"]:
+        line += f"\n{'':<20} imported at startup: {', '.join(report['forbidden'])}"
+    return line
+
+
+def run_benchmarks(
+    faults: FaultConfig = FaultConfig(),
+    files: int = 50,
+    years: int = 3,
+    workers: int = 8,
+) -> List[Dict]:
+    """Run every benchmark against a fresh FakeServer and return the reports.
+
+    Downloads go to a temporary folder. Run through main() (python -m
+    pastpaper.bench) so the ledger and caches go to a temporary
+    PASTPAPER_LOG_DIR instead of ~/pastpaper_logs.
+    """
+    from pastpaper import scraper
+
+    work = tempfile.mkdtemp(prefix="pastpaper-bench-")
+    try:
+        with FakeServer(faults) as server:
+            scraper.configure(server=server.url)
+            return [
+                bench_download_with_retry(server, os.path.join(work, "single"), files),
+                bench_scrape_subject(server, os.path.join(work, "pipeline"), years, workers),
+            ]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"{report['benchmark']:<20} {report['files']:>5} files  "
+        f"{report['files_per_sec']:>8.1f} files/s  "
+        f"{report['bytes_per_sec'] / 1024 / 1024:>7.2f} MiB/s  "
+        f"p50 {report['p50'] * 1000:>7.1f} ms  p99 {report['p99'] * 1000:>7.1f} ms"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark downloads against a local fake pastpapers.co"
+    )
+    parser.add_argument("--files", type=int, default=50, help="files for download_with_retry")
+    parser.add_argument("--years", type=int, default=3, help="years of papers for scrape_subject")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="only check CLI startup time; exits 1 if it is over --startup-budget",
+    )
+    parser.add_argument(
+        "--startup-budget", type=float, default=STARTUP_BUDGET, help="seconds the CLI import may take"
+    )
+    for field, default in FaultConfig._field_defaults.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup:
+        report = bench_startup(args.startup_budget)
+        print(json.dumps(report, indent=2) if args.json else format_startup(report))
+        sys.exit(0 if report["ok"] else 1)
+    faults = FaultConfig(**{field: getattr(args, field) for field in FaultConfig._fields})
+    state = tempfile.mkdtemp(prefix="pastpaper-bench-state-")
+    # Must be set before the modules that read LOG_DIR are imported
+    os.environ.setdefault("PASTPAPER_LOG_DIR", state)
+    try:
+        reports = run_benchmarks(faults, args.files, args.years, args.workers)
+    finally:
+        shutil.rmtree(state, ignore_errors=True)
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+    else:
+        for report in reports:
+            print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+
+from pastpaper.utils import LOG_DIR
+
+NEGATIVE_CACHE_PATH = os.path.join(LOG_DIR, "negative_cache.json")
+METADATA_PATH = os.path.join(LOG_DIR, "metadata.json")
+
+DAY = 24 * 60 * 60
+# How long a 404 is trusted for sessions that are long finished...
+NEGATIVE_TTL = 30 * DAY
+# ...and for sessions whose papers may still be published
+RECENT_TTL = 1 * DAY
+RECENT_SESSION_DAYS = 180
+
+SESSION_MONTHS = {"March": 3, "May-June": 6, "Oct-Nov": 11}
+SESSION_FOLDER_RE = re.compile(r"/(20\d{2})-(March|May-June|Oct-Nov)/")
+
+
+def session_is_recent(url: str, now: float | None = None) -> bool:
+    """True if the URL's 20YY-Session folder sat its exams within the last
+    RECENT_SESSION_DAYS, i.e. files may still appear upstream.
+    Unknown folders count as recent so they are never cached for long.
+    """
+    match = SESSION_FOLDER_RE.search(url)
+    if not match:
+        return True
+    year, session = int(match.group(1)), match.group(2)
+    exams = time.mktime((year, SESSION_MONTHS[session], 1, 0, 0, 0, 0, 0, -1))
+    return (now or time.time()) - exams < RECENT_SESSION_DAYS * DAY
+
+
+@contextmanager
+def _flocked(path: str):
+    """Hold an exclusive flock on the file at `path` (created if need be).
+    On Windows, without fcntl, nothing is locked.
+    """
+    with open(path, "a") as f:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class JsonStore:
+    """A dict persisted as one JSON file. Changes stay in memory until save(),
+    which rewrites the file atomically.
+
+    Several processes may share a store: save() re-reads the file under a
+    lock and writes back only the keys this one set or removed since it
+    last read it, so concurrent runs keep each other's entries. Subclasses
+    replace values, never change them in place, which is how changed keys
+    are told apart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._read()
+        self._saved = dict(self._entries)  # as last read or written
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _prune(self, entries: dict) -> dict:
+        return entries
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with _flocked(self.path + ".lock"):
+                entries = self._read()
+                for key, value in self._entries.items():
+                    if self._saved.get(key) is not value:
+                        entries[key] = value
+                for key in self._saved.keys() - self._entries.keys():
+                    entries.pop(key, None)
+                entries = self._prune(entries)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._saved = dict(entries)
+            self._dirty = False
+
+
+class NegativeCache(JsonStore):
+    """On-disk record of URLs that answered 404, keyed by URL.
+
+    Entries expire after `ttl` seconds, or `recent_ttl` for sessions that
+    may still be published.
+    """
+
+    def __init__(
+        self,
+        path: str = NEGATIVE_CACHE_PATH,
+        ttl: float = NEGATIVE_TTL,
+        recent_ttl: float = RECENT_TTL,
+    ):
+        super().__init__(path)
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+
+    def is_missing(self, url: str) -> bool:
+        with self._lock:
+            seen = self._entries.get(url)
+        if seen is None:
+            return False
+        now = time.time()
+        ttl = self.recent_ttl if session_is_recent(url, now) else self.ttl
+        return now - seen < ttl
+
+    def add(self, url: str) -> None:
+        with self._lock:
+            self._entries[url] = time.time()
+            self._dirty = True
+
+    def discard(self, url: str) -> None:
+        with self._lock:
+            if self._entries.pop(url, None) is not None:
+                self._dirty = True
+
+    def purge(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
+        self.save()
+
+    def _prune(self, entries: dict) -> dict:
+        # Drop entries that can no longer be trusted under either TTL
+        now = time.time()
+        return {
+            url: seen
+            for url, seen in entries.items()
+            if now - seen < max(self.ttl, self.recent_ttl)
+        }
+
+
+class MetadataStore(JsonStore):
+    """Validators (ETag, Last-Modified) and size of every downloaded file,
+    keyed by output path, used to revalidate files with conditional requests.
+    """
+
+    def __init__(self, path: str = METADATA_PATH):
+        super().__init__(path)
+
+    def get(self, out_path: str) -> dict | None:
+        with self._lock:
+            return self._entries.get(out_path)
+
+    def record(self, out_path: str, url: str, headers, size: int) -> None:
+        entry = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "size": size,
+        }
+        with self._lock:
+            self._entries[out_path] = entry
+            self._dirty = True
+
+    def conditional_headers(self, out_path: str) -> dict:
+        """Headers that make a GET for out_path answer 304 if unchanged.
+        Files downloaded before validators were recorded fall back to their
+        modification time.
+        """
+        entry = self.get(out_path) or {}
+        try:
+            st = os.stat(out_path)
+        except OSError:
+            return {}
+        if entry.get("size") is not None and entry["size"] != st.st_size:
+            # The local copy doesn't match what was downloaded; fetch it again
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers or {"If-Modified-Since": formatdate(st.st_mtime, usegmt=True)}
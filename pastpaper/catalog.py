@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pastpaper.cache import DAY, JsonStore
+from pastpaper.subjects import SUBJECTS
+from pastpaper.utils import LOG_DIR
+
+CATALOG_PATH = os.path.join(LOG_DIR, "catalog.json")
+# How long a fetched subject list is used before it is revalidated
+CATALOG_TTL = 7 * DAY
+# After a failed fetch, seconds before this process tries the site again
+FAILURE_BACKOFF = 300
+# The level folder subjects are listed in (every LEVELS entry uses it)
+DEFAULT_LEVEL = "A-Level"
+# "Physics (9702)", "Physics-9702", "Computer Science (for first examination in 2021) (9618)"
+SUBJECT_FOLDER_RE = re.compile(r"^(?P<name>.*?\S)\s*(?:-|\()\s*(?P<code>\d{4})\)?$")
+
+
+class Subject(NamedTuple):
+    name: str  # lower case, as in SUBJECTS; names the download folder
+    code: str
+    slug: str  # the subject's folder on the site
+
+
+def builtin_subjects() -> List[Subject]:
+    """The subjects in subjects.SUBJECTS, used until a listing is fetched."""
+    return [Subject(*entry) for entry in SUBJECTS.values() if entry[1] != "all"]
+
+
+def subject_from_folder(folder: str) -> Optional[Subject]:
+    """A Subject for a subject folder name, or None if it has no code."""
+    match = SUBJECT_FOLDER_RE.match(folder.strip())
+    if not match:
+        return None
+    # Drop qualifiers such as "(for first examination in 2021)"
+    name = re.sub(r"\s*\([^)]*\)", "", match.group("name"))
+    name = " ".join(name.split()).lower()
+    return Subject(name or match.group("code"), match.group("code"), folder.strip())
+
+
+def parse_subject_listing(html: str, level: str) -> List[Subject]:
+    """Subjects linked from a level folder listing page."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    found = {}
+    for a in soup.find_all("a"):
+        href = urllib.parse.unquote(a.get("href", ""))
+        folder = urllib.parse.parse_qs(urllib.parse.urlsplit(href).query).get("dir", [""])[0]
+        parts = folder.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == level:
+            candidate = parts[1]
+        else:
+            candidate = a.get_text()
+        subject = subject_from_folder(candidate)
+        if subject is not None:
+            found.setdefault(subject.slug, subject)
+    return list(found.values())
+
+
+class Catalog(JsonStore):
+    """Every subject the site lists for a level, discovered from the level
+    folder listing and cached on disk.
+
+    A listing is used for `ttl` seconds, then revalidated with its ETag
+    (or Last-Modified), so most launches make no request at all. If the
+    site can't be reached the cached copy is used however old it is, and
+    with no copy the built-in SUBJECTS. Entries are keyed by listing URL,
+    so a --server override keeps its own catalog. Lookups go through
+    indexes by code and by name or slug.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH, ttl: float = CATALOG_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+        self._indexes: Dict[str, Tuple[List[Subject], Dict[str, Subject], Dict[str, Subject]]] = {}
+        self._failed: Dict[str, float] = {}
+        self._fetch_lock = threading.Lock()
+
+    @staticmethod
+    def _key(level: str) -> str:
+        from pastpaper import scraper
+
+        return f"{scraper.BASE_LISTING}?dir={level}"
+
+    def _fetch(self, level: str, entry: Optional[dict], timeout: int = 15) -> Optional[dict]:
+        """Fetch (or revalidate) a level listing. Returns the new cache entry,
+        or None if it couldn't be fetched.
+        """
+        from pastpaper.scraper import BASE_LISTING, get_session
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            with get_session().get(
+                BASE_LISTING, params={"dir": level}, headers=headers, timeout=timeout
+            ) as r:
+                if r.status_code == 304 and entry:
+                    return dict(entry, fetched=time.time())
+                if r.status_code != 200:
+                    logging.error(f"Subject listing unavailable ({r.status_code}): {level}")
+                    return None
+                subjects = parse_subject_listing(r.text, level)
+                validators = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        except Exception as e:
+            logging.error(f"Subject listing request error for {level}: {e}")
+            return None
+        if not subjects:
+            logging.error(f"No subjects found in the listing of {level}")
+            return None
+        return {
+            "fetched": time.time(),
+            "etag": validators[0],
+            "last_modified": validators[1],
+            "subjects": [list(subject) for subject in subjects],
+        }
+
+    def refresh(self, level: str = DEFAULT_LEVEL, force: bool = False) -> bool:
+        """Revalidate the level's listing if it is older than the TTL (or
+        always, with `force`). Returns False if the site couldn't be reached.
+        """
+        key = self._key(level)
+        with self._fetch_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if not force and entry and time.time() - entry["fetched"] < self.ttl:
+                return True
+            if not force and time.time() - self._failed.get(key, 0) < FAILURE_BACKOFF:
+                return False
+            fresh = self._fetch(level, entry)
+            if fresh is None:
+                self._failed[key] = time.time()
+                return False
+            with self._lock:
+                self._entries[key] = fresh
+                self._dirty = True
+                self._indexes.pop(key, None)
+        self.save()
+        return True
+
+    def _index(self, level: str):
+        key = self._key(level)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                return index
+            entry = self._entries.get(key)
+            listed = [Subject(*subject) for subject in entry["subjects"]] if entry else []
+            builtin = builtin_subjects()
+            names = {subject.code: subject.name for subject in builtin}
+            by_code: Dict[str, Subject] = {}
+            # Built-in names keep their download folders; their slugs are
+            # only used for codes the site doesn't list
+            for subject in listed + builtin:
+                if subject.code not in by_code:
+                    by_code[subject.code] = subject._replace(name=names.get(subject.code, subject.name))
+            subjects = sorted(by_code.values(), key=lambda subject: (subject.name, subject.code))
+            by_name = {}
+            for subject in subjects:
+                by_name.setdefault(subject.name, subject)
+                by_name.setdefault(subject.slug.lower(), subject)
+            index = self._indexes[key] = (subjects, by_code, by_name)
+            return index
+
+    def subjects(self, level: str = DEFAULT_LEVEL) -> List[Subject]:
+        """Every subject of the level, by name, refreshing the listing if due."""
+        self.refresh(level)
+        return list(self._index(level)[0])
+
+    def find(self, value: str, level: str = DEFAULT_LEVEL) -> Optional[Subject]:
+        """The subject with this code, name or slug (any case), or None."""
+        value = str(value).strip()
+        self.refresh(level)
+        _, by_code, by_name = self._index(level)
+        return by_code.get(value) or by_name.get(value.lower())
+
+    def slug(self, code: str, level: str = DEFAULT_LEVEL) -> str:
+        """The site folder of a subject code; a guess if the code is unknown."""
+        subject = self.find(code, level)
+        return subject.slug if subject else f"Subject-{code}"
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """The process-wide catalog at CATALOG_PATH, loaded on first use."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
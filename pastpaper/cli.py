@@ -1,9 +1,17 @@
+import argparse
 import curses
+import logging
 import os
+import sys
+import threading
 import time
 
-from pastpaper.scraper import scrape_subject
+# Keep this module light: the HTTP and scraping stack (requests, bs4, tqdm)
+# is imported where downloads start, so the first menu appears at once
+from pastpaper.batch import DEFAULT_ROOT, subject_dir
 from pastpaper.subjects import LEVELS, PAPER_TYPES, SESSIONS, SUBJECTS
+from pastpaper.utils import ERROR_LOG, enable_error_log
+from pastpaper.widgets import ListWidget
 
 LOGO = [
     "  ____   _    ____ _____   ____   _    ____  _____ ____  ",
@@ -18,6 +26,8 @@ LOGO = [
 
 MIN_WIDTH = 70
 MIN_HEIGHT = 19
+# Redraws per second of the download screen
+FRAME_RATE = 10
 
 
 def check_terminal_size(stdscr):
@@ -60,116 +70,62 @@ def center_text(stdscr, text, y, color=None, bold=False):
             stdscr.attroff(curses.A_BOLD)
 
 
-def multiselect(stdscr, title, options, logo=None):
-    curses.curs_set(0)
+def _init_menu_colors():
     curses.start_color()
     curses.use_default_colors()
     curses.init_pair(1, curses.COLOR_CYAN, -1)
     curses.init_pair(2, curses.COLOR_YELLOW, -1)
     curses.init_pair(3, curses.COLOR_GREEN, -1)
     curses.init_pair(4, curses.COLOR_MAGENTA, -1)
-    selected = set()
-    idx = 0
-    keys = list(options.keys())
 
-    while True:
+
+def _logo_background(stdscr, logo):
+    def background():
         check_terminal_size(stdscr)
-        stdscr.clear()
         stdscr.border()
-        # Draw logo if provided
         logo_height = 0
         if logo:
             for i, line in enumerate(logo):
                 center_text(stdscr, line, i + 1, color=1, bold=True)
             logo_height = len(logo) + 2
-        center_text(stdscr, title, logo_height, color=1, bold=True)
+        return logo_height
 
-        for i, key in enumerate(keys):
-            marker = "✔" if key in selected else "○"
-            line = f"{marker} {options[key][0] if isinstance(options[key], tuple) else options[key]}"
-            height, width = stdscr.getmaxyx()
-            if len(line) > width - 6:
-                line = line[: max(0, width - 9)] + "..."
-            y = logo_height + 2 + i
-            if i == idx:
-                stdscr.attron(curses.color_pair(2))
-                stdscr.attron(curses.A_REVERSE)
-                stdscr.addstr(y, 4, line)
-                stdscr.attroff(curses.A_REVERSE)
-                stdscr.attroff(curses.color_pair(2))
-            else:
-                stdscr.addstr(y, 4, line)
+    return background
 
-        center_text(
-            stdscr,
-            "SPACE = select | ENTER = confirm | ESC = quit",
-            logo_height + 4 + len(keys),
-            color=3,
-        )
-        keypress = stdscr.getch()
 
-        if keypress == curses.KEY_UP and idx > 0:
-            idx -= 1
-        elif keypress == curses.KEY_DOWN and idx < len(keys) - 1:
-            idx += 1
-        elif keypress == ord(" "):
-            k = keys[idx]
-            selected.symmetric_difference_update({k})
-        elif keypress in (10, 13):
-            return list(selected)
-        elif keypress == 27:
-            exit(0)
+def multiselect(stdscr, title, options, logo=None):
+    _init_menu_colors()
+    return ListWidget(stdscr, title, options, multi=True, background=_logo_background(stdscr, logo)).run()
 
 
 def singleselect(stdscr, title, options, logo=None):
-    curses.curs_set(0)
-    curses.start_color()
-    curses.use_default_colors()
-    curses.init_pair(1, curses.COLOR_CYAN, -1)
-    curses.init_pair(2, curses.COLOR_YELLOW, -1)
-    idx = 0
-    keys = list(options.keys())
+    _init_menu_colors()
+    return ListWidget(stdscr, title, options, background=_logo_background(stdscr, logo)).run()
 
-    while True:
-        check_terminal_size(stdscr)
-        stdscr.clear()
-        stdscr.border()
-        # Draw logo if provided
-        logo_height = 0
-        if logo:
-            for i, line in enumerate(logo):
-                center_text(stdscr, line, i + 1, color=1, bold=True)
-            logo_height = len(logo) + 2
-        center_text(stdscr, title, logo_height, color=1, bold=True)
-
-        for i, key in enumerate(keys):
-            value = options[key][0] if isinstance(options[key], tuple) else options[key]
-            height, width = stdscr.getmaxyx()
-            if len(value) > width - 6:
-                value = value[: max(0, width - 9)] + "..."
-            y = logo_height + 2 + i
-            if i == idx:
-                stdscr.attron(curses.color_pair(2))
-                stdscr.attron(curses.A_REVERSE)
-                stdscr.addstr(y, 4, value)
-                stdscr.attroff(curses.A_REVERSE)
-                stdscr.attroff(curses.color_pair(2))
-            else:
-                stdscr.addstr(y, 4, value)
 
-        keypress = stdscr.getch()
+import signal
 
-        if keypress == curses.KEY_UP and idx > 0:
-            idx -= 1
-        elif keypress == curses.KEY_DOWN and idx < len(keys) - 1:
-            idx += 1
-        elif keypress in (10, 13):
-            return keys[idx]
-        elif keypress == 27:
-            exit(0)
 
+def subject_options(stdscr, level_slug):
+    """Every subject in the catalog as (name, code, slug), "all" first.
+    Shows a loading line while the listing is fetched (at most weekly).
+    """
+    from pastpaper.catalog import get_catalog
 
-import signal
+    check_terminal_size(stdscr)
+    stdscr.clear()
+    stdscr.border()
+    center_text(stdscr, "Loading subjects...", draw_logo_centered(stdscr), color=1)
+    stdscr.refresh()
+    options = {"all": SUBJECTS["5"]}
+    for subject in get_catalog().subjects(level_slug):
+        options[subject.code] = tuple(subject)
+    return options
+
+
+def subject_label(value):
+    name, code, _ = value
+    return name if code == "all" else f"{name} ({code})"
 
 
 def draw_logo_centered(stdscr):
@@ -191,7 +147,7 @@ def draw_logo_centered(stdscr):
     return y_credits + 1
 
 
-def tui(stdscr):
+def tui(stdscr, args=None):
     curses.curs_set(0)
     curses.start_color()
     curses.use_default_colors()
@@ -201,92 +157,13 @@ def tui(stdscr):
     curses.init_pair(4, curses.COLOR_MAGENTA, -1)
     curses.init_pair(5, curses.COLOR_WHITE, -1)
 
-    def redraw_selection(draw_func, *args, **kwargs):
-        stdscr.clear()
-        stdscr.border()
-        logo_bottom = draw_logo_centered(stdscr)
-        return draw_func(stdscr, *args, logo_bottom=logo_bottom, **kwargs)
-
-    def singleselect_centered(stdscr, title, options, logo_bottom=0):
-        curses.curs_set(0)
-        idx = 0
-        keys = list(options.keys())
-        while True:
-            check_terminal_size(stdscr)
-            stdscr.clear()
-            stdscr.border()
-            draw_logo_centered(stdscr)
-            center_text(stdscr, title, logo_bottom, color=1, bold=True)
-            for i, key in enumerate(keys):
-                value = (
-                    options[key][0] if isinstance(options[key], tuple) else options[key]
-                )
-                height, width = stdscr.getmaxyx()
-                if len(value) > width - 6:
-                    value = value[: max(0, width - 9)] + "..."
-                y = logo_bottom + 2 + i
-                if i == idx:
-                    stdscr.attron(curses.color_pair(2))
-                    stdscr.attron(curses.A_REVERSE)
-                    stdscr.addstr(y, 4, value)
-                    stdscr.attroff(curses.A_REVERSE)
-                    stdscr.attroff(curses.color_pair(2))
-                else:
-                    stdscr.addstr(y, 4, value)
-            keypress = stdscr.getch()
-            if keypress == curses.KEY_UP and idx > 0:
-                idx -= 1
-            elif keypress == curses.KEY_DOWN and idx < len(keys) - 1:
-                idx += 1
-            elif keypress in (10, 13):
-                return keys[idx]
-            elif keypress == 27:
-                exit(0)
-
-    def multiselect_centered(stdscr, title, options, logo_bottom=0):
-        curses.curs_set(0)
-        selected = set()
-        idx = 0
-        keys = list(options.keys())
-        while True:
+    def choose(title, options, multi=False, **kwargs):
+        def background():
             check_terminal_size(stdscr)
-            stdscr.clear()
             stdscr.border()
-            draw_logo_centered(stdscr)
-            center_text(stdscr, title, logo_bottom, color=1, bold=True)
-            for i, key in enumerate(keys):
-                marker = "✔" if key in selected else "○"
-                line = f"{marker} {options[key][0] if isinstance(options[key], tuple) else options[key]}"
-                height, width = stdscr.getmaxyx()
-                if len(line) > width - 6:
-                    line = line[: max(0, width - 9)] + "..."
-                y = logo_bottom + 2 + i
-                if i == idx:
-                    stdscr.attron(curses.color_pair(2))
-                    stdscr.attron(curses.A_REVERSE)
-                    stdscr.addstr(y, 4, line)
-                    stdscr.attroff(curses.A_REVERSE)
-                    stdscr.attroff(curses.color_pair(2))
-                else:
-                    stdscr.addstr(y, 4, line)
-            center_text(
-                stdscr,
-                "SPACE = select | ENTER = confirm | ESC = quit",
-                logo_bottom + 4 + len(keys),
-                color=3,
-            )
-            keypress = stdscr.getch()
-            if keypress == curses.KEY_UP and idx > 0:
-                idx -= 1
-            elif keypress == curses.KEY_DOWN and idx < len(keys) - 1:
-                idx += 1
-            elif keypress == ord(" "):
-                k = keys[idx]
-                selected.symmetric_difference_update({k})
-            elif keypress in (10, 13):
-                return list(selected)
-            elif keypress == 27:
-                exit(0)
+            return draw_logo_centered(stdscr)
+
+        return ListWidget(stdscr, title, options, multi=multi, background=background, **kwargs).run()
 
     # Dynamic resizing handler
     def handle_resize(sig, frame):
@@ -297,21 +174,22 @@ def tui(stdscr):
     signal.signal(signal.SIGWINCH, handle_resize)
 
     # Always show logo and selection below it, centered
-    level_key = redraw_selection(singleselect_centered, "Select Level", LEVELS)
-    subject_key = redraw_selection(singleselect_centered, "Select Subject", SUBJECTS)
-    paper_key = redraw_selection(
-        singleselect_centered, "Select Paper Type", PAPER_TYPES
-    )
-    
+    level_key = choose("Select Level", LEVELS)
+    level_ui, level_slug = LEVELS[level_key]
+    subjects = subject_options(stdscr, level_slug)
+    subject_key = choose("Select Subject", subjects, label=subject_label)
+    subject_name, subject_code, subject_slug = subjects[subject_key]
+    paper_key = choose("Select Paper Type", PAPER_TYPES)
+
     # Session selection (with validation)
     while True:
         # Filter sessions for Computer Science
         available_sessions = SESSIONS
-        if subject_key == "4": # Computer Science (9618)
+        if subject_code == "9618":
             available_sessions = {k: v for k, v in SESSIONS.items() if v[0] != "march"}
-            
-        session_keys = redraw_selection(
-            multiselect_centered, "Select Sessions (SPACE to select, ENTER to confirm)", available_sessions
+
+        session_keys = choose(
+            "Select Sessions (SPACE to select, ENTER to confirm)", available_sessions, multi=True
         )
         if session_keys:
             break
@@ -372,20 +250,15 @@ def tui(stdscr):
 
     paper_numbers = [p.strip() for p in paper_nums_raw.split(",") if p.strip()] or None
 
-    level_ui, level_slug = LEVELS[level_key]
-    subject_name, subject_code, subject_slug = SUBJECTS[subject_key]
     paper_type = PAPER_TYPES[paper_key]
 
     session_codes = [SESSIONS[k][1] for k in session_keys]
     session_slugs = [SESSIONS[k][2] for k in session_keys]
     year_codes = [y.strip()[-2:] for y in years if y.strip()]
 
-    out_dir = os.path.join(
-        os.path.expanduser("~"),
-        "Documents",
-        "past paper",
-        f"{subject_name.replace(' ', '_')}-{subject_code}",
-    )
+    out_dir = DEFAULT_ROOT
+    if subject_code != "all":
+        out_dir = subject_dir(DEFAULT_ROOT, subject_name, subject_code)
 
     # Summary screen
     while True:
@@ -426,60 +299,75 @@ def tui(stdscr):
             except Exception:
                 pass
 
-    def show_progress_bar(stdscr, total, current, y, width=40):
+    def show_progress_bar(stdscr, total, current, y, width=40, x=4):
         percent = int((current / total) * 100) if total else 0
         filled = int(width * current // total) if total else 0
         bar = "[" + "#" * filled + "-" * (width - filled) + "]"
-        stdscr.addstr(y, 4, f"{bar} {percent}% ({current}/{total})")
+        stdscr.addstr(y, x, f"{bar} {percent}% ({current}/{total})")
 
-    def draw_log_panel(stdscr, start_y):
+    def draw_log_panel(stdscr, panel_y, x=4):
         height, width = stdscr.getmaxyx()
-        log_dir = os.path.expanduser("~/pastpaper_logs")
-        log_path = os.path.join(log_dir, "download_status.log")
-        
-        panel_y = start_y + 2
+
         if panel_y >= height - 2:
             return
 
         stdscr.attron(curses.color_pair(4) | curses.A_BOLD)
-        stdscr.addstr(panel_y, 4, "--- BACKGROUND TASK MONITOR ---")
+        stdscr.addstr(panel_y, x, "--- BACKGROUND TASK MONITOR ---")
         stdscr.attroff(curses.color_pair(4) | curses.A_BOLD)
 
-        if not os.path.exists(log_path):
-            stdscr.addstr(panel_y + 1, 6, "No activity yet...")
+        # Show last 5-8 events depending on space
+        max_lines = min(height - panel_y - 4, 8)
+        events = bus.tail(max_lines) if max_lines > 0 else []
+        if not events:
+            stdscr.addstr(panel_y + 1, x + 2, "No activity yet...")
             return
 
-        try:
-            with open(log_path, "r") as f:
-                lines = f.readlines()
-                # Show last 5-8 lines depending on space
-                max_lines = min(height - panel_y - 4, 8)
-                display_lines = lines[-max_lines:] if lines else []
-                for i, line in enumerate(display_lines):
-                    # Truncate if too long
-                    msg = line.strip()
-                    if len(msg) > width - 10:
-                        msg = msg[:width-13] + "..."
-                    stdscr.addstr(panel_y + 1 + i, 6, msg)
-        except Exception:
-            stdscr.addstr(panel_y + 1, 6, "Error reading logs")
+        for i, event in enumerate(events):
+            when = time.strftime("%H:%M:%S", time.localtime(event.ts))
+            msg = f"{when} | {event.status} | {os.path.basename(event.out_path)}"
+            # Truncate if too long
+            if len(msg) > width - 10:
+                msg = msg[:width-13] + "..."
+            stdscr.addstr(panel_y + 1 + i, x + 2, msg)
 
     # Build download tasks
-    from pastpaper.scraper import build_download_tasks, download_with_retry
-
-    tasks = build_download_tasks(
-        subject_code=subject_code,
-        subject_slug=subject_slug,
-        level_slug=level_slug,
-        selected_type=paper_type,
-        session_codes=session_codes,
-        session_slugs=session_slugs,
-        years=year_codes,
-        paper_numbers=paper_numbers,
-        out_dir=out_dir,
-    )
+    from pastpaper.cache import MetadataStore, NegativeCache
+    from pastpaper.engine import DownloadEngine
+    from pastpaper.events import bus, enable_file_log
+    from pastpaper.batch import iter_job_tasks
+    from pastpaper.inventory import Inventory
+    from pastpaper.metrics import RunMetrics
+    from pastpaper.scraper import http_session, iter_download_tasks, paper_kinds
+    from pastpaper.store import BlobStore
+
+    # Tasks are generated lazily; downloads start with the first folder listed
+    if subject_code == "all":
+        # Every subject, each into its own folder, through the batch planner
+        tasks = iter_job_tasks(
+            {
+                "subjects": "all",
+                "levels": level_ui,
+                "kinds": paper_kinds(paper_type),
+                "sessions": [SESSIONS[k][0] for k in session_keys],
+                "years": year_codes,
+                "papers": paper_numbers,
+            },
+            root=out_dir,
+        )
+    else:
+        tasks = iter_download_tasks(
+            subject_code=subject_code,
+            subject_slug=subject_slug,
+            level_slug=level_slug,
+            selected_type=paper_type,
+            session_codes=session_codes,
+            session_slugs=session_slugs,
+            years=year_codes,
+            paper_numbers=paper_numbers,
+            out_dir=out_dir,
+        )
 
-    if not tasks:
+    def no_papers():
         stdscr.clear()
         stdscr.border()
         logo_bottom = draw_logo_centered(stdscr)
@@ -488,74 +376,446 @@ def tui(stdscr):
         center_text(stdscr, "Press any key to exit.", logo_bottom + 4, color=3)
         stdscr.getch()
         curses.endwin()
-        return
 
-    # Download loop with progress bar
-    while True:
-        check_terminal_size(stdscr)
+    def download_failed(error):
         stdscr.clear()
         stdscr.border()
         logo_bottom = draw_logo_centered(stdscr)
-        center_text(stdscr, "Downloading...", logo_bottom, color=1, bold=True)
-        total = len(tasks)
-        y_bar = logo_bottom + 2
-        y_status = logo_bottom + 4
-        for i, (url, out_path) in enumerate(tasks, 1):
-            stdscr.clear()
-            stdscr.border()
-            logo_bottom = draw_logo_centered(stdscr)
-            center_text(stdscr, "Downloading...", logo_bottom, color=1, bold=True)
-            
-            y_bar = logo_bottom + 2
-            y_status = logo_bottom + 4
-            
-            show_progress_bar(stdscr, total, i, y_bar)
-            
-            # Check if file already exists
-            if os.path.exists(out_path):
-                from pastpaper.scraper import log_download_status
-                log_download_status(subject_slug, url, out_path, "SKIPPED")
-                line = f"Skipping (exists): {os.path.basename(out_path)}"
-            else:
-                line = f"Processing {i}/{total}: {os.path.basename(out_path)}"
-                
-            height, width = stdscr.getmaxyx()
-            if len(line) > width - 10:
-                line = line[: width - 13] + "..."
-            stdscr.addstr(y_status, 4, line)
-            stdscr.refresh()
-            
-            if not os.path.exists(out_path):
-                success = download_with_retry(url, out_path)
-            
-            # After each task, we refresh the view to show the log entry from scraper
-            draw_log_panel(stdscr, y_status + 2)
-            stdscr.refresh()
-            time.sleep(0.05)
-            
+        center_text(stdscr, "Download Failed!", logo_bottom, color=2, bold=True)
+        center_text(stdscr, f"{type(error).__name__}: {error}"[: stdscr.getmaxyx()[1] - 6], logo_bottom + 2)
+        center_text(stdscr, f"Details are in {ERROR_LOG}", logo_bottom + 3)
+        center_text(stdscr, "Press any key to exit.", logo_bottom + 5, color=3)
+        stdscr.getch()
+        curses.endwin()
+
+    if args is not None and args.dry_run:
+        from pastpaper.planner import make_plan
+
+        plan = make_plan(
+            tasks, inventory=Inventory(out_dir, BlobStore(DEFAULT_ROOT)).scan(), head=args.head
+        )
+        if not plan:
+            no_papers()
+            return
         stdscr.clear()
         stdscr.border()
         logo_bottom = draw_logo_centered(stdscr)
-        center_text(stdscr, "Download Complete!", logo_bottom, color=3, bold=True)
-        show_progress_bar(stdscr, total, total, logo_bottom + 2)
-        draw_log_panel(stdscr, logo_bottom + 4)
-        center_text(
-            stdscr,
-            "Download complete! Press any key to exit.",
-            logo_bottom + 11,
-            color=3,
-        )
-        
-        # Automatically open the folder where papers were downloaded (macOS only)
-        open_folder(out_dir)
-        
+        center_text(stdscr, "Dry run: nothing was downloaded", logo_bottom, color=4, bold=True)
+        for i, line in enumerate(plan.describe()):
+            center_text(stdscr, line, logo_bottom + 2 + i)
+        center_text(stdscr, "Press any key to exit.", logo_bottom + 3 + len(plan.describe()), color=3)
         stdscr.getch()
-        break
+        return
+
+    # Downloads run on a background thread; the screen is redrawn at a fixed
+    # frame rate and only the progress and log windows are repainted
+    total = 0
+    discovering = True
+    done = 0
+    status_line = ""
+
+    def counted(tasks):
+        nonlocal total, discovering
+        for task in tasks:
+            total += 1
+            yield task
+        discovering = False
+
+    def on_result(result):
+        nonlocal done, status_line
+        done += 1
+        name = os.path.basename(result.out_path)
+        if result.status == "SKIPPED":
+            status_line = f"Skipping (exists): {name}"
+        elif result.status == "MISSING":
+            status_line = f"Not published: {name}"
+        elif result.status == "NOT_MODIFIED":
+            status_line = f"Up to date: {name}"
+        elif result.status == "LINKED":
+            status_line = f"Already stored: {name}"
+        else:
+            status_line = f"Processed {done}/{total}: {name} ({result.status.lower()})"
+
+    enable_file_log()
+    use_cache = args is None or not args.no_cache
+    store = BlobStore(DEFAULT_ROOT)
+    engine = DownloadEngine(
+        negative_cache=NegativeCache() if use_cache else None,
+        metadata=MetadataStore(),
+        revalidate=args is not None and args.revalidate,
+        store=store,
+        inventory=Inventory(out_dir, store),
+    )
+
+    error = None
+
+    def run_downloads():
+        nonlocal error
+        try:
+            with RunMetrics() as metrics, http_session(engine.workers):
+                engine.run(counted(tasks), on_result=on_result)
+            metrics.write()
+        except Exception as e:
+            # Shown once curses is done with the progress screen
+            enable_error_log()
+            logging.exception("Download run failed")
+            error = e
+
+    worker = threading.Thread(target=run_downloads, daemon=True)
+    worker.start()
+
+    def layout():
+        # Full repaint only when starting and after a resize
+        check_terminal_size(stdscr)
+        stdscr.clear()
+        stdscr.border()
+        logo_bottom = draw_logo_centered(stdscr)
+        height, width = stdscr.getmaxyx()
+        progress_win = curses.newwin(5, width - 2, logo_bottom, 1)
+        log_win = curses.newwin(max(1, height - logo_bottom - 7), width - 2, logo_bottom + 6, 1)
+        stdscr.noutrefresh()
+        return progress_win, log_win
+
+    progress_win, log_win = layout()
+    stdscr.timeout(1000 // FRAME_RATE)
+    while worker.is_alive():
+        keypress = stdscr.getch()
+        if keypress == curses.KEY_RESIZE:
+            progress_win, log_win = layout()
+        elif keypress in (ord("p"), ord("P")) and not engine.cancelled:
+            if engine.paused:
+                engine.resume()
+            else:
+                engine.pause()
+        elif keypress in (ord("c"), ord("C"), 27):
+            engine.cancel()
+
+        if engine.cancelled:
+            title = "Cancelling... (waiting for running downloads)"
+        elif engine.paused:
+            title = "Paused"
+        elif engine.scanning:
+            title = "Checking the papers you already have..."
+        elif discovering:
+            title = f"Downloading... (finding papers, {total} so far)"
+        else:
+            title = "Downloading..."
+        try:
+            progress_win.erase()
+            center_text(progress_win, title, 0, color=1, bold=True)
+            show_progress_bar(progress_win, total, done, 2, x=3)
+            height, width = progress_win.getmaxyx()
+            line = status_line
+            if len(line) > width - 8:
+                line = line[: width - 11] + "..."
+            progress_win.addstr(4, 3, line)
+            progress_win.noutrefresh()
+
+            log_win.erase()
+            draw_log_panel(log_win, 0, x=3)
+            height, width = log_win.getmaxyx()
+            center_text(log_win, "P = pause/resume | C = cancel", height - 1, color=3)
+            log_win.noutrefresh()
+        except curses.error:
+            pass
+        curses.doupdate()
+    stdscr.timeout(-1)
+    worker.join()
+    if error is not None:
+        download_failed(error)
+        return
+    if not total and not engine.cancelled:
+        no_papers()
+        return
+
+    stdscr.clear()
+    stdscr.border()
+    logo_bottom = draw_logo_centered(stdscr)
+    if engine.cancelled:
+        center_text(stdscr, "Download Cancelled", logo_bottom, color=2, bold=True)
+    else:
+        center_text(stdscr, "Download Complete!", logo_bottom, color=3, bold=True)
+    show_progress_bar(stdscr, total, done, logo_bottom + 2)
+    draw_log_panel(stdscr, logo_bottom + 6)
+    center_text(
+        stdscr,
+        "Press any key to exit.",
+        logo_bottom + 11,
+        color=3,
+    )
+
+    # Automatically open the folder where papers were downloaded (macOS only)
+    open_folder(out_dir)
+
+    stdscr.getch()
     curses.endwin()
 
 
-def main():
-    curses.wrapper(tui)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pastpaper", description="Download CAIE AS & A Level past papers."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="ignore the cache of papers known to be missing and probe every URL",
+    )
+    parser.add_argument(
+        "--purge-cache",
+        action="store_true",
+        help="empty the cache of papers known to be missing before starting",
+    )
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="re-check already downloaded papers and fetch only those changed upstream",
+    )
+    parser.add_argument(
+        "--server",
+        help="download from this server instead of pastpapers.co (e.g. a pastpaper.fakeserver)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="show what would be downloaded, and roughly how much, then stop",
+    )
+    parser.add_argument(
+        "--head",
+        action="store_true",
+        help="with --dry-run, ask the server for sizes the ledger doesn't know",
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    ledger = commands.add_parser("ledger", help="inspect or compact the download ledger")
+    ledger.add_argument("action", choices=["summary", "failures", "history", "compact"])
+    ledger.add_argument("--url", help="only show the history of this URL")
+    ledger.add_argument(
+        "--keep-days",
+        type=float,
+        help="when compacting, also drop entries older than this many days",
+    )
+
+    batch = commands.add_parser(
+        "batch", help="download everything described by a JSON job file, without the UI"
+    )
+    batch.add_argument("job", help="path to the job file")
+    batch.add_argument("--workers", type=int, help="number of parallel downloads")
+    batch.add_argument("--summary", help="write the JSON summary here instead of stdout")
+    batch.add_argument("--quiet", action="store_true", help="no progress bar")
+    batch.add_argument(
+        "--shard", metavar="I/N", help="only do part I of N of the job (e.g. 2/4), for runs split across machines"
+    )
+
+    mirror = commands.add_parser(
+        "mirror", help="keep a local copy of the whole catalog in sync, without the UI"
+    )
+    mirror.add_argument("--root", default=DEFAULT_ROOT, help="download root to mirror into")
+    mirror.add_argument(
+        "--since", type=int, help="first exam year to mirror (default 2015)"
+    )
+    mirror.add_argument(
+        "--full", action="store_true", help="re-list every folder, ignoring the checkpoint"
+    )
+    mirror.add_argument("--workers", type=int, default=8, help="number of parallel downloads")
+    mirror.add_argument("--quiet", action="store_true", help="no progress bar")
+    mirror.add_argument(
+        "--shard", metavar="I/N", help="only mirror part I of N of the catalog (e.g. 2/4)"
+    )
+
+    store = commands.add_parser("store", help="inspect or prune the content store")
+    store.add_argument("action", choices=["stats", "prune"])
+    store.add_argument("--root", default=DEFAULT_ROOT, help="download root holding the store")
+
+    subjects = commands.add_parser("subjects", help="list the subjects the site offers")
+    subjects.add_argument("filter", nargs="?", help="only subjects whose name or code contains this")
+    subjects.add_argument("--refresh", action="store_true", help="fetch the list again now")
+
+    index = commands.add_parser("index", help="build or update the full-text search index")
+    index.add_argument("--root", default=DEFAULT_ROOT, help="download root to index")
+    index.add_argument("--workers", type=int, help="processes parsing PDFs (default: one per CPU)")
+    index.add_argument("--full", action="store_true", help="parse every file again")
+    index.add_argument("--quiet", action="store_true", help="no progress bar")
+
+    search = commands.add_parser("search", help="search the downloaded papers")
+    search.add_argument("query", nargs="+", help="words every paper must contain; end a word with * for a prefix")
+    search.add_argument("--root", default=DEFAULT_ROOT, help="download root that was indexed")
+    search.add_argument("--subject", help="only papers of this subject code, e.g. 9709")
+    search.add_argument("--kind", help="only this kind of paper, e.g. qp or ms")
+    search.add_argument("--limit", type=int, default=20, help="at most this many results")
+    search.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def batch_command(args):
+    import json
+
+    from pastpaper.batch import JobError, load_job, preview_job, run_job
+
+    try:
+        job = load_job(args.job)
+        if args.no_cache:
+            job["no_cache"] = True
+        if args.revalidate:
+            job["revalidate"] = True
+        if args.workers:
+            job["workers"] = args.workers
+        if args.shard:
+            job["shard"] = args.shard
+        if args.dry_run:
+            print(json.dumps(preview_job(job, head=args.head), indent=2))
+            return 0
+        summary = run_job(job, workers=args.workers, progress=not args.quiet)
+    except (OSError, JobError) as e:
+        print(f"pastpaper batch: {e}", file=sys.stderr)
+        return 2
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+def ledger_command(args):
+    from pastpaper.ledger import get_ledger
+
+    ledger = get_ledger()
+    if args.action == "summary":
+        for status, count in sorted(ledger.summary().items()):
+            print(f"{status}: {count}")
+    elif args.action == "failures":
+        for row in ledger.failures():
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['ts']))
+            print(f"{when} | {row['url']} -> {row['path']}")
+    elif args.action == "history":
+        for row in ledger.history(url=args.url):
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['ts']))
+            print(f"{when} | {row['subject']} | {row['status']} | {row['url']} -> {row['path']}")
+    elif args.action == "compact":
+        removed = ledger.compact(keep_days=args.keep_days)
+        print(f"removed {removed} ledger entries")
+
+
+def mirror_command(args):
+    import json
+
+    from pastpaper.batch import JobError, parse_shard
+    from pastpaper.mirror import run_mirror
+
+    try:
+        shard = parse_shard(args.shard)
+    except JobError as e:
+        print(f"pastpaper mirror: {e}", file=sys.stderr)
+        return 2
+    summary = run_mirror(
+        args.root,
+        since=args.since,
+        full=args.full,
+        workers=args.workers,
+        revalidate=args.revalidate,
+        progress=not args.quiet,
+        shard=shard,
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+def store_command(args):
+    from pastpaper.store import BlobStore, StoreError
+
+    store = BlobStore(args.root)
+    if args.action == "stats":
+        stats = store.stats()
+        print(f"{stats['blobs']} files, {stats['bytes'] / 1024 / 1024:.1f} MiB in {store.root}")
+    elif args.action == "prune":
+        try:
+            removed = store.prune()
+        except StoreError as e:
+            print(f"pastpaper store: not pruning, {e}", file=sys.stderr)
+            return 2
+        print(f"removed {removed} unreferenced files")
+
+
+def subjects_command(args):
+    from pastpaper.catalog import get_catalog
+
+    catalog = get_catalog()
+    if args.refresh and not catalog.refresh(force=True):
+        print("pastpaper subjects: could not reach the site, showing the cached list", file=sys.stderr)
+    text = (args.filter or "").lower()
+    for subject in catalog.subjects():
+        if text in subject.name or text in subject.code:
+            print(f"{subject.code}  {subject.name:<32} {subject.slug}")
+
+
+def index_command(args):
+    import json
+
+    from pastpaper.search import ExtractorMissing, SearchIndex
+
+    try:
+        stats = SearchIndex(args.root).build(workers=args.workers, full=args.full, progress=not args.quiet)
+    except ExtractorMissing as e:
+        print(f"pastpaper index: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+def search_command(args):
+    import json
+
+    from pastpaper.search import SearchIndex
+
+    index = SearchIndex(args.root)
+    if not index.exists():
+        print("pastpaper search: no index yet, run `pastpaper index` first", file=sys.stderr)
+        return 2
+    start = time.perf_counter()
+    with index:
+        hits = index.search(" ".join(args.query), subject=args.subject, kind=args.kind, limit=args.limit)
+    elapsed = time.perf_counter() - start
+    if args.json:
+        print(json.dumps([hit._asdict() for hit in hits], indent=2))
+        return 0
+    for hit in hits:
+        pages = ", ".join(str(page) for page in hit.pages[:8])
+        print(f"{hit.path}  (p. {pages})")
+        if hit.snippet:
+            print(f"    ...{hit.snippet}...")
+        if hit.pair:
+            print(f"    pair: {hit.pair}")
+    print(f"{len(hits)} results in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.server:
+        from pastpaper.scraper import configure
+
+        configure(server=args.server)
+    if args.purge_cache:
+        from pastpaper.cache import NegativeCache
+
+        NegativeCache().purge()
+    if args.command == "ledger":
+        ledger_command(args)
+        return
+    if args.command == "batch":
+        sys.exit(batch_command(args))
+    if args.command == "mirror":
+        sys.exit(mirror_command(args))
+    if args.command == "store":
+        sys.exit(store_command(args))
+    if args.command == "subjects":
+        subjects_command(args)
+        return
+    if args.command == "index":
+        sys.exit(index_command(args))
+    if args.command == "search":
+        sys.exit(search_command(args))
+    curses.wrapper(tui, args)
 
 
 if __name__ == "__main__":
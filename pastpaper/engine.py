@@ -0,0 +1,427 @@
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from pastpaper.cache import MetadataStore, NegativeCache
+from pastpaper.events import bus
+from pastpaper.inventory import Inventory
+from pastpaper.lease import RECHECK_INTERVAL, Leases
+from pastpaper.ledger import get_ledger
+from pastpaper.ratelimit import AdaptiveLimiter
+from pastpaper.scraper import fetch_once, log_download_status, subject_from_url
+from pastpaper.store import BlobStore
+
+DEFAULT_WORKERS = 8
+
+_END = object()  # end of the task feed
+
+
+class RetryPolicy(NamedTuple):
+    attempts: int  # including the first one
+    base: float  # seconds before the first retry, doubled for each one after
+    cap: float  # longest delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Jittered exponential delay after failed attempt number `attempt`."""
+        ceiling = min(self.cap, self.base * 2 ** (attempt - 1))
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        return max(delay, retry_after or 0.0)
+
+
+# Keyed by the error classes of scraper.Attempt
+RETRY_POLICIES = {
+    "timeout": RetryPolicy(attempts=4, base=2.0, cap=60.0),
+    "connection": RetryPolicy(attempts=4, base=2.0, cap=60.0),
+    # Cut-short bodies resume from their .part file, so retry quickly
+    "incomplete": RetryPolicy(attempts=5, base=1.0, cap=30.0),
+    "server": RetryPolicy(attempts=3, base=5.0, cap=120.0),
+    "throttled": RetryPolicy(attempts=6, base=10.0, cap=300.0),
+    # An HTML page instead of a PDF rarely fixes itself; one late retry
+    "invalid": RetryPolicy(attempts=2, base=30.0, cap=30.0),
+}
+
+
+class TaskResult(NamedTuple):
+    url: str
+    out_path: str
+    # SUCCESS, LINKED (from the content store), FAIL, SKIPPED, MISSING
+    # (404, possibly cached), NOT_MODIFIED or CANCELLED
+    status: str
+    elapsed: float
+    attempts: int = 1
+    error: Optional[str] = None  # error class of the last failed attempt
+
+
+class _Retry(NamedTuple):
+    url: str
+    out_path: str
+    attempt: int  # number of the attempt to make
+    elapsed: float
+    etag: Optional[str] = None
+    exists: Optional[bool] = None  # whether out_path exists, if known
+
+
+class DownloadEngine:
+    """Run (url, out_path) download tasks across a bounded pool of workers.
+
+    At most `workers` downloads run at once, and at most `per_host` of those
+    (all of them by default) talk to the same host. Results are handed back
+    to the caller's thread, so curses and tqdm callers can update their
+    display from `on_result`.
+    URLs known to 404 in `negative_cache` are not requested again.
+    Existing files are skipped, unless `revalidate` is set: then they are
+    requested conditionally with the validators kept in `metadata`.
+    With an `inventory` (an inventory.Inventory), tasks are checked against
+    it in memory instead of on disk: good files are skipped and corrupt
+    ones are deleted and downloaded again. It is scanned on the producer
+    thread when run() starts (`scanning` is true meanwhile), so callers
+    with a display can draw it straight away.
+    With a `store`, downloads are committed to the content-addressed store
+    and a missing file whose content the ledger already knows (same URL,
+    blob still stored) is linked in without any request. Each download
+    then also holds a lease in the store (see lease.Leases), so runs that
+    share the download root, on this machine or others, never fetch the
+    same file at once: a file leased elsewhere is looked at again every
+    RECHECK_INTERVAL seconds and skipped once it has arrived.
+    Requests share one AdaptiveLimiter, which adjusts the request rate and
+    the number of concurrent requests (up to `workers`) to server feedback.
+    pause(), resume() and cancel() may be called from any thread while run()
+    is going; they take effect before the next task starts.
+
+    A failed attempt doesn't hold up its worker: the task goes onto a
+    deferred retry queue with a jittered exponential delay from the
+    RetryPolicy of its error class, and other tasks keep flowing meanwhile.
+    `retries`, if given, caps the attempts of any policy. Tasks that run out
+    of attempts get one last try in a final sweep once everything else is
+    done.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        per_host: Optional[int] = None,
+        retries: Optional[int] = None,
+        timeout: int = 15,
+        negative_cache: Optional[NegativeCache] = None,
+        metadata: Optional[MetadataStore] = None,
+        revalidate: bool = False,
+        limiter: Optional[AdaptiveLimiter] = None,
+        retry_policies: Optional[dict] = None,
+        store: Optional[BlobStore] = None,
+        inventory: Optional[Inventory] = None,
+    ):
+        self.workers = max(1, workers)
+        self.per_host = max(1, min(per_host or self.workers, self.workers))
+        self.retries = retries
+        self.timeout = timeout
+        self.negative_cache = negative_cache
+        self.metadata = metadata
+        self.revalidate = revalidate and metadata is not None
+        self.limiter = limiter or AdaptiveLimiter(max_concurrency=self.workers)
+        self.retry_policies = retry_policies or RETRY_POLICIES
+        self.store = store
+        self.leases = Leases(store.lease_dir()) if store is not None else None
+        self.inventory = inventory
+        self.scanning = False
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def pause(self) -> None:
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _max_attempts(self, error: Optional[str]) -> int:
+        policy = self.retry_policies.get(error)
+        if policy is None:
+            return 1
+        if self.retries is not None:
+            return min(policy.attempts, self.retries)
+        return policy.attempts
+
+    def _run_one(self, task: _Retry) -> Tuple[TaskResult, Optional[_Retry], Optional[float]]:
+        """Make one attempt at a task. Returns its result, plus the retry to
+        schedule and its Retry-After if the attempt failed.
+        """
+        url, out_path = task.url, task.out_path
+        self._running.wait()
+        if self._cancelled.is_set():
+            return TaskResult(url, out_path, "CANCELLED", task.elapsed, task.attempt - 1), None, None
+        if self.leases is None:
+            return self._fetch(task)
+        if not self.leases.acquire(url):
+            # Another run is fetching it; the retry keeps its attempt number
+            result = TaskResult(url, out_path, "FAIL", task.elapsed, task.attempt - 1, "leased")
+            return result, task, RECHECK_INTERVAL
+        try:
+            if task.exists is False and os.path.exists(out_path):
+                # Another run fetched it since this one planned it
+                log_download_status(subject_from_url(url), url, out_path, "SKIPPED")
+                return TaskResult(url, out_path, "SKIPPED", task.elapsed, task.attempt - 1), None, None
+            return self._fetch(task)
+        finally:
+            self.leases.release(url)
+
+    def _fetch(self, task: _Retry) -> Tuple[TaskResult, Optional[_Retry], Optional[float]]:
+        url, out_path = task.url, task.out_path
+        start = time.monotonic()
+        exists = task.exists if task.exists is not None else os.path.exists(out_path)
+        with self._slot(url):
+            attempt = fetch_once(
+                url,
+                out_path,
+                timeout=self.timeout,
+                metadata=self.metadata,
+                conditional=exists,
+                limiter=self.limiter,
+                etag=task.etag,
+                store=self.store,
+            )
+        elapsed = task.elapsed + time.monotonic() - start
+        result = TaskResult(
+            url, out_path, attempt.status, elapsed, task.attempt, attempt.error
+        )
+        if self.negative_cache is not None:
+            if attempt.status == "MISSING":
+                self.negative_cache.add(url)
+            elif attempt.status == "SUCCESS":
+                self.negative_cache.discard(url)
+        if attempt.status != "FAIL":
+            return result, None, None
+        retry = _Retry(url, out_path, task.attempt + 1, elapsed, attempt.etag, exists)
+        return result, retry, attempt.retry_after
+
+    def _link_known(self, url: str, out_path: str) -> bool:
+        digest = get_ledger().latest_digest(url)
+        if digest is None or not self.store.has(digest):
+            return False
+        try:
+            self.store.link(digest, out_path)
+        except OSError:
+            return False
+        log_download_status(
+            subject_from_url(url), url, out_path, "LINKED",
+            size=os.path.getsize(out_path), sha256=digest,
+        )
+        return True
+
+    def _filter(self, url: str, out_path: str):
+        """First stage for a new task: a TaskResult if it can be settled
+        without a request (already present, cached 404, or linked from the
+        store), otherwise the _Retry for its first attempt.
+        """
+        state = self.inventory.state(out_path) if self.inventory is not None else None
+        if state is None:
+            state = "ok" if os.path.exists(out_path) else "missing"
+        if state == "corrupt":
+            logging.error(f"Corrupt local file, downloading again: {out_path}")
+            if self.store is not None:
+                # A link shares its blob's inode, so the blob is damaged too
+                self.store.discard(self.inventory.get(out_path).sha256)
+            if os.path.exists(out_path):
+                os.remove(out_path)
+        elif state == "ok":
+            if self.revalidate:
+                return _Retry(url, out_path, 1, 0.0, exists=True)
+            log_download_status(subject_from_url(url), url, out_path, "SKIPPED")
+            return TaskResult(url, out_path, "SKIPPED", 0.0, 0)
+        if self.negative_cache is not None and self.negative_cache.is_missing(url):
+            bus.publish("skipped", url, out_path, subject=subject_from_url(url), status="MISSING")
+            return TaskResult(url, out_path, "MISSING", 0.0, 0)
+        if self.store is not None and self._link_known(url, out_path):
+            return TaskResult(url, out_path, "LINKED", 0.0, 0)
+        return _Retry(url, out_path, 1, 0.0, exists=False)
+
+    def _feed(self, tasks: Iterable[Tuple[str, str]], out: queue.Queue) -> None:
+        """Producer thread: pull tasks from the (possibly lazy) iterable, filter
+        them and hand them on through the bounded queue `out`.
+        """
+        try:
+            if self.inventory is not None:
+                self.scanning = True
+                try:
+                    # Hashes every new file, so it can take a while
+                    self.inventory.scan()
+                finally:
+                    self.scanning = False
+            for url, out_path in tasks:
+                if self._cancelled.is_set():
+                    break
+                item = self._filter(url, out_path)
+                while not self._cancelled.is_set():
+                    try:
+                        out.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            out.put(e)
+        finally:
+            out.put(_END)
+
+    def run(
+        self,
+        tasks: Iterable[Tuple[str, str]],
+        on_result: Optional[Callable[[TaskResult], None]] = None,
+    ) -> List[TaskResult]:
+        """Download the tasks and return their results, in completion order.
+        `tasks` may be a lazy iterable: it is consumed on a producer thread
+        through a bounded queue while downloads run, and at most
+        2 x `workers` first attempts are queued on the pool at once, so
+        memory stays flat however many tasks there are. With `on_result`,
+        results are handed to it instead of being collected.
+        """
+        results = []
+        retry_queue = []  # heap of (due, seq, _Retry)
+        seq = itertools.count()
+        sweep = []  # tasks out of attempts, for one last try at the end
+        swept = set()
+
+        def finish(result):
+            if result.status == "FAIL":
+                log_download_status(subject_from_url(result.url), result.url, result.out_path, "FAIL")
+            if on_result:
+                on_result(result)
+            else:
+                results.append(result)
+
+        fresh = queue.Queue(maxsize=self.workers * 4)
+        feeder = threading.Thread(target=self._feed, args=(tasks, fresh), daemon=True)
+        feeder.start()
+        feeding = True
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            while feeding or pending or retry_queue or sweep:
+                # Top up the pool with new tasks; wait for them only when idle
+                while feeding and len(pending) < self.workers * 2:
+                    try:
+                        item = fresh.get(timeout=0.05) if not pending else fresh.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        feeding = False
+                    elif isinstance(item, Exception):
+                        error = item
+                    elif isinstance(item, TaskResult):
+                        finish(item)
+                    else:
+                        pending.add(pool.submit(self._run_one, item))
+                if self._cancelled.is_set():
+                    if feeding:
+                        # Unblock the producer; it stops at the next task
+                        while True:
+                            try:
+                                item = fresh.get_nowait()
+                            except queue.Empty:
+                                break
+                            if item is _END:
+                                feeding = False
+                            elif isinstance(item, _Retry):
+                                finish(TaskResult(item.url, item.out_path, "CANCELLED", 0.0, 0))
+                    for _, _, task in retry_queue:
+                        finish(TaskResult(task.url, task.out_path, "CANCELLED", task.elapsed, task.attempt - 1))
+                    retry_queue = []
+                    for task in sweep:
+                        finish(TaskResult(task.url, task.out_path, "FAIL", task.elapsed, task.attempt - 1))
+                    sweep = []
+                now = time.monotonic()
+                while retry_queue and retry_queue[0][0] <= now:
+                    _, _, task = heapq.heappop(retry_queue)
+                    pending.add(pool.submit(self._run_one, task))
+                if not feeding and not pending and not retry_queue and sweep:
+                    pending = {pool.submit(self._run_one, task) for task in sweep}
+                    swept.update((task.url, task.out_path) for task in sweep)
+                    sweep = []
+                if not pending:
+                    if retry_queue and not feeding:
+                        time.sleep(max(0.0, retry_queue[0][0] - time.monotonic()))
+                    continue
+
+                timeout = retry_queue[0][0] - now if retry_queue else None
+                if feeding:
+                    # Wake up regularly to take in newly discovered tasks
+                    timeout = min(timeout, 0.05) if timeout is not None else 0.05
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, retry, retry_after = future.result()
+                    if retry is None:
+                        finish(result)
+                    elif result.error == "leased":
+                        heapq.heappush(retry_queue, (time.monotonic() + retry_after, next(seq), retry))
+                    elif (result.url, result.out_path) in swept:
+                        finish(result)
+                    elif retry.attempt <= self._max_attempts(result.error):
+                        policy = self.retry_policies[result.error]
+                        due = time.monotonic() + policy.delay(result.attempts, retry_after)
+                        heapq.heappush(retry_queue, (due, next(seq), retry))
+                    elif result.error == "invalid":
+                        finish(result)
+                    else:
+                        sweep.append(retry)
+
+        for store in (self.negative_cache, self.metadata, self.inventory):
+            if store is not None:
+                store.save()
+        if error is not None:
+            raise error
+        return results
+
+
+def run_tasks(
+    tasks: Iterable[Tuple[str, str]],
+    workers: int = DEFAULT_WORKERS,
+    per_host: Optional[int] = None,
+    retries: Optional[int] = None,
+    timeout: int = 15,
+    on_result: Optional[Callable[[TaskResult], None]] = None,
+    negative_cache: Optional[NegativeCache] = None,
+    metadata: Optional[MetadataStore] = None,
+    revalidate: bool = False,
+    store: Optional[BlobStore] = None,
+    inventory: Optional[Inventory] = None,
+) -> List[TaskResult]:
+    engine = DownloadEngine(
+        workers,
+        per_host,
+        retries=retries,
+        timeout=timeout,
+        negative_cache=negative_cache,
+        metadata=metadata,
+        revalidate=revalidate,
+        store=store,
+        inventory=inventory,
+    )
+    return engine.run(tasks, on_result=on_result)
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional
+
+from pastpaper.utils import LOG_DIR, append_locked
+
+# Status log statuses and the event kind each one is published as
+STATUS_EVENTS = {
+    "SUCCESS": "success",
+    "LINKED": "success",
+    "SKIPPED": "skipped",
+    "NOT_MODIFIED": "skipped",
+    "MISSING": "skipped",
+    "FAIL": "failed",
+}
+
+
+class RequestTiming(NamedTuple):
+    """Where the time of one HTTP request went, in seconds."""
+
+    connect: float  # TCP (and TLS) setup; 0.0 on a reused keep-alive connection
+    ttfb: float  # request sent to response headers in, connecting excluded
+    transfer: float  # reading the body
+    bytes: int  # body bytes received
+    http_status: Optional[int] = None  # None if no response came back
+    outcome: str = ""  # the Attempt status, or FAIL:<error>
+    wait: float = 0.0  # held back by the rate limiter before sending
+
+
+class Event(NamedTuple):
+    ts: float
+    kind: str  # started, progress, request, success, skipped or failed
+    url: str
+    out_path: str
+    subject: str = "unknown"
+    status: str = ""  # the status log status, for finished tasks
+    size: Optional[int] = None
+    total: Optional[int] = None
+    timing: Optional[RequestTiming] = None  # for request events
+
+
+class EventBus:
+    """Fan download events out to subscribers and keep the last `maxlen`
+    finished-task events in a ring buffer for display.
+
+    Subscribers run on the publishing (worker) thread and must be quick.
+    Progress and request events go to subscribers only, so they never push
+    finished tasks out of the buffer.
+    """
+
+    def __init__(self, maxlen: int = 200):
+        self._recent = deque(maxlen=maxlen)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Event], None]) -> None:
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Event], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, kind: str, url: str, out_path: str, **fields) -> Event:
+        event = Event(time.time(), kind, url, out_path, **fields)
+        with self._lock:
+            if kind not in ("started", "progress", "request"):
+                self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(event)
+        return event
+
+    def tail(self, n: int) -> List[Event]:
+        """The last n finished-task events, oldest first."""
+        with self._lock:
+            count = min(n, len(self._recent))
+            return [self._recent[-i] for i in range(count, 0, -1)]
+
+
+bus = EventBus()
+
+
+class FileLogSink:
+    """Append finished-task events to the plain-text status log, which
+    concurrent runs may be writing to as well.
+    """
+
+    def __init__(self, path: str = os.path.join(LOG_DIR, "download_status.log")):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        if not event.status:
+            return
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event.ts))
+        line = f"{timestamp} | {event.subject} | {event.status} | {event.url} -> {event.out_path}\n"
+        with self._lock:
+            append_locked(self.path, line)
+
+
+_file_log = None
+
+
+def enable_file_log() -> None:
+    """Subscribe the text status log to the shared bus (once per process)."""
+    global _file_log
+    if _file_log is None:
+        _file_log = FileLogSink()
+        bus.subscribe(_file_log)
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple, Optional
+
+# Session folders are named like the real site's; "2024-s" doesn't exist
+SESSION_CODES = {"March": "m", "May-June": "s", "Oct-Nov": "w"}
+PAPERS = ["11", "12", "13", "21", "22", "23", "31", "32", "33", "41", "42", "43"]
+PAPER_KINDS = ["qp", "ms", "in"]
+SESSION_KINDS = ["er", "gt"]  # one file per session
+FOLDER_RE = re.compile(r"^20(\d{2})-([\w-]+)$")
+# Subject folders of every level, named like the real site's
+SUBJECT_FOLDERS = [
+    "Accounting (9706)",
+    "Biology (9700)",
+    "Business (9609)",
+    "Chemistry (9701)",
+    "Computer Science (for first examination in 2021) (9618)",
+    "Economics (9708)",
+    "Further Mathematics (9231)",
+    "Mathematics (9709)",
+    "Physics (9702)",
+    "Psychology (9990)",
+]
+FILE_RE = re.compile(r"^(\d{4})_([msw])(\d{2})_([a-z]{2})(?:_(\d+))?\.pdf$")
+
+
+class FaultConfig(NamedTuple):
+    latency: float = 0.0  # seconds before every response
+    jitter: float = 0.0  # up to this much extra latency, at random
+    missing: float = 0.0  # share of papers that don't exist: 404, left out of listings
+    throttle: float = 0.0  # share of file requests answered 429
+    retry_after: int = 1  # Retry-After of those 429s
+    truncate: float = 0.0  # share of bodies cut off halfway
+    html: float = 0.0  # share of file requests answered with an HTML page
+    size: int = 200 * 1024  # bytes per synthetic PDF
+    seed: int = 0
+
+
+def _fraction(name: str, salt: str = "") -> float:
+    """A stable pseudo-random number in [0, 1) for a file name."""
+    digest = hashlib.sha1(f"{salt}{name}".encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32
+
+
+def synthetic_pdf(name: str, size: int) -> bytes:
+    """A deterministic body of about `size` bytes that passes the PDF checks."""
+    head = f"%PDF-1.4\n% {name}\n".encode()
+    trailer = b"\n%%EOF\n"
+    filler = hashlib.sha256(name.encode()).hexdigest().encode() + b"\n"
+    count = max(0, size - len(head) - len(trailer))
+    return head + (filler * (count // len(filler) + 1))[:count] + trailer
+
+
+class FakeServer:
+    """Local stand-in for pastpapers.co, for benchmarks and offline runs.
+
+    Serves folder listings at /cie/?dir=<level>/<subject>/<session> (and
+    the SUBJECT_FOLDERS at /cie/?dir=<level>) and synthetic PDFs at
+    /api/file/<board>/<level>/<subject>/<session>/<file>, with the faults
+    in FaultConfig injected. Every subject has qp, ms and in files for
+    PAPERS, plus er and gt, in every session folder, minus the `missing`
+    share. Bodies support Range and ETag/If-None-Match like the real site. `stats` counts requests by status code and bytes sent.
+    Point the downloader at it with scraper.configure(server=server.url) or
+    PASTPAPER_SERVER; `python -m pastpaper.fakeserver` runs one standalone.
+    """
+
+    def __init__(self, faults: FaultConfig = FaultConfig(), host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults
+        self.stats = {"requests": 0, "bytes": 0}
+        self._random = random.Random(faults.seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def roll(self, chance: float) -> bool:
+        if chance <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < chance
+
+    def count(self, status: int, size: int = 0) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats[status] = self.stats.get(status, 0) + 1
+            self.stats["bytes"] += size
+
+    def exists(self, name: str) -> bool:
+        return _fraction(name, str(self.faults.seed)) >= self.faults.missing
+
+    def listing(self, directory: str) -> Optional[list]:
+        """File names in a level/subject/session folder, subject folders
+        for a level folder, or None if the folder isn't recognised.
+        """
+        parts = directory.strip("/").split("/")
+        if len(parts) == 1 and parts[0]:
+            return list(SUBJECT_FOLDERS)
+        if len(parts) != 3:
+            return None
+        code = re.search(r"(\d{4})\)?$", parts[1])
+        folder = FOLDER_RE.match(parts[2])
+        if not code or not folder or folder.group(2) not in SESSION_CODES:
+            return None
+        prefix = f"{code.group(1)}_{SESSION_CODES[folder.group(2)]}{folder.group(1)}"
+        names = [f"{prefix}_{kind}_{paper}.pdf" for kind in PAPER_KINDS for paper in PAPERS]
+        names += [f"{prefix}_{kind}.pdf" for kind in SESSION_KINDS]
+        return [name for name in names if self.exists(name)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.fake.count(status, len(body))
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False):
+        fake = self.server.fake
+        faults = fake.faults
+        delay = faults.latency + (random.uniform(0, faults.jitter) if faults.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path)
+        if path.rstrip("/") == "/cie":
+            self._listing(urllib.parse.parse_qs(url.query).get("dir", [""])[0])
+        elif path.startswith("/api/file/"):
+            self._file(path, head)
+        else:
+            self._send(404)
+
+    def _listing(self, directory: str) -> None:
+        names = self.server.fake.listing(directory)
+        if names is None:
+            self._send(404)
+            return
+        rows = "".join(
+            f'<tr><td><a href="?dir={urllib.parse.quote(directory)}/{name}">{name}</a></td></tr>'
+            for name in names
+        )
+        body = f"<html><body><table>{rows}</table></body></html>".encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        self._send(200, body, {"Content-Type": "text/html; charset=utf-8", "ETag": etag})
+
+    def _file(self, path: str, head: bool) -> None:
+        fake = self.server.fake
+        faults = fake.faults
+        name = path.rsplit("/", 1)[-1]
+        folder = FOLDER_RE.match(path.rsplit("/", 2)[-2])
+        match = FILE_RE.match(name)
+        if (
+            not match
+            or not fake.exists(name)
+            or not folder
+            or SESSION_CODES.get(folder.group(2)) != match.group(2)
+            or folder.group(1) != match.group(3)
+        ):
+            self._send(404)
+            return
+        if fake.roll(faults.throttle):
+            self._send(429, headers={"Retry-After": str(faults.retry_after)})
+            return
+        if fake.roll(faults.html):
+            body = b"<html><body>Please enable JavaScript</body></html>"
+            self._send(200, body, {"Content-Type": "text/html"})
+            return
+
+        body = synthetic_pdf(name, faults.size)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        headers = {"Content-Type": "application/pdf", "ETag": etag}
+        start = 0
+        status = 200
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            if start >= len(body):
+                self._send(416, headers={"Content-Range": f"bytes */{len(body)}"})
+                return
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+        body = body[start:]
+        if head:
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            fake.count(status)
+            return
+        if fake.roll(faults.truncate):
+            # Advertise the whole body, send half of it and hang up
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            fake.count(status, len(body) // 2)
+            return
+        self._send(status, body, headers)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for pastpapers.co")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for field, default in FaultConfig._field_defaults.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    faults = FaultConfig(**{field: getattr(args, field) for field in FaultConfig._fields})
+    server = FakeServer(faults, args.host, args.port).start()
+    print(f"serving on {server.url} (PASTPAPER_SERVER={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pastpaper.cache import JsonStore
+from pastpaper.scraper import PDF_MAGIC, PDF_TRAILER, TRAILER_WINDOW
+from pastpaper.utils import LOG_DIR
+
+INVENTORY_DIR = os.path.join(LOG_DIR, "inventory")
+
+
+class FileInfo(NamedTuple):
+    size: int
+    mtime_ns: int
+    sha256: str
+    ok: bool  # starts with %PDF and ends with %%EOF
+
+
+def examine(path: str, size: int, digest: Optional[str] = None) -> Tuple[str, bool]:
+    """sha256 and PDF sanity of one file. With a known `digest` (a link to a
+    store blob) only the head and tail are read.
+    """
+    hasher = None if digest else hashlib.sha256()
+    with open(path, "rb") as f:
+        head = f.read(len(PDF_MAGIC))
+        if hasher is not None:
+            hasher.update(head)
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        f.seek(max(0, size - TRAILER_WINDOW))
+        tail = f.read()
+    ok = size > 0 and head == PDF_MAGIC and PDF_TRAILER in tail
+    return digest or hasher.hexdigest(), ok
+
+
+class Inventory(JsonStore):
+    """What is already on disk under `root`, built by one scandir walk.
+
+    Every directory is cached with its mtime, subdirectories and the size,
+    mtime, sha256 and PDF sanity of its files. A rescan only lists
+    directories whose mtime moved (a file was added, removed or replaced)
+    and only re-reads files whose size or mtime changed, so an unchanged
+    library of any size is checked in a few milliseconds. Files that are
+    links into `store` (a store.BlobStore) take their hash from the blob.
+    Hidden directories (the store itself) are not scanned. The cache lives
+    in INVENTORY_DIR, one file per root, so saving it doesn't touch the tree.
+    """
+
+    def __init__(self, root: str, store=None, path: Optional[str] = None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        key = hashlib.sha1(self.root.encode()).hexdigest()[:16]
+        super().__init__(path or os.path.join(INVENTORY_DIR, f"{key}.json"))
+        self.store = store
+        self._files: Dict[str, FileInfo] = {}
+        self._blobs = None
+
+    def _blob_digest(self, st: os.stat_result) -> Optional[str]:
+        if self.store is None or st.st_nlink < 2:
+            return None
+        if self._blobs is None:
+            self._blobs = {}
+            for dirpath, _, filenames in os.walk(os.path.join(self.store.root, "sha256")):
+                for name in filenames:
+                    blob = os.stat(os.path.join(dirpath, name))
+                    self._blobs[(blob.st_dev, blob.st_ino)] = name[:-len(".pdf")]
+        return self._blobs.get((st.st_dev, st.st_ino))
+
+    def scan(self) -> "Inventory":
+        old = self._entries
+        dirs = {}
+        files = {}
+        self._blobs = None
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            full = os.path.join(self.root, rel)
+            try:
+                mtime_ns = os.stat(full).st_mtime_ns
+            except OSError:
+                continue
+            cached = old.get(rel)
+            if cached is None or cached["mtime_ns"] != mtime_ns:
+                cached = self._scan_dir(full, mtime_ns, cached)
+                self._dirty = self._dirty or cached != old.get(rel)
+            dirs[rel] = cached
+            for name, info in cached["files"].items():
+                files[os.path.join(rel, name)] = FileInfo(*info)
+            stack.extend(os.path.join(rel, name) for name in cached["subdirs"])
+        if dirs.keys() != old.keys():
+            self._dirty = True
+        with self._lock:
+            self._entries = dirs
+            self._files = files
+        return self
+
+    def _scan_dir(self, full: str, mtime_ns: int, cached: Optional[dict]) -> dict:
+        known = cached["files"] if cached else {}
+        subdirs = []
+        found = {}
+        with os.scandir(full) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.endswith(".pdf") and entry.is_file():
+                    st = entry.stat()
+                    info = known.get(entry.name)
+                    if info is None or info[:2] != [st.st_size, st.st_mtime_ns]:
+                        try:
+                            digest, ok = examine(entry.path, st.st_size, self._blob_digest(st))
+                        except OSError:
+                            continue
+                        info = [st.st_size, st.st_mtime_ns, digest, ok]
+                    found[entry.name] = info
+        return {"mtime_ns": mtime_ns, "subdirs": sorted(subdirs), "files": found}
+
+    def _relpath(self, out_path: str) -> Optional[str]:
+        rel = os.path.relpath(os.path.abspath(out_path), self.root)
+        return None if rel.startswith(os.pardir) else rel
+
+    def get(self, out_path: str) -> Optional[FileInfo]:
+        rel = self._relpath(out_path)
+        return self._files.get(rel) if rel else None
+
+    def files(self) -> Dict[str, FileInfo]:
+        """Every PDF found by the last scan, keyed by path relative to the root."""
+        with self._lock:
+            return dict(self._files)
+
+    def state(self, out_path: str) -> Optional[str]:
+        """"ok", "corrupt" or "missing"; None for paths outside the root."""
+        rel = self._relpath(out_path)
+        if rel is None:
+            return None
+        info = self._files.get(rel)
+        if info is None:
+            return "missing"
+        return "ok" if info.ok else "corrupt"
+
+    def diff(self, tasks: Iterable[Tuple[str, str]]) -> Dict[Optional[str], List[Tuple[str, str]]]:
+        """Split (url, out_path) tasks by state(); key None holds tasks outside the root."""
+        split = {"ok": [], "corrupt": [], "missing": [], None: []}
+        for url, out_path in tasks:
+            split[self.state(out_path)].append((url, out_path))
+        return split
+
+    def summary(self) -> dict:
+        return {
+            "files": len(self._files),
+            "bytes": sum(info.size for info in self._files.values()),
+            "corrupt": sum(not info.ok for info in self._files.values()),
+        }
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict
+
+# A lease nobody renewed for this long belongs to a run that died
+LEASE_TTL = 300.0
+# Seconds before a file leased by another run is looked at again
+RECHECK_INTERVAL = 5.0
+
+
+class Leases:
+    """Per-file leases in a directory shared by every run writing to the
+    same download root, whichever process or machine they run on.
+
+    A lease is a file created with O_CREAT | O_EXCL, which only one run
+    can win even on NFS. Held leases are renewed (their mtime touched) in
+    the background every `ttl` / 4 seconds, so one untouched for `ttl`
+    seconds is taken to be abandoned and may be broken by the next run
+    that wants it. Leases are keyed like the store's partial downloads,
+    by URL, so whoever holds one also owns its .part file.
+    """
+
+    def __init__(self, directory: str, ttl: float = LEASE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._held: Dict[str, str] = {}  # lease path -> token
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".lease")
+
+    def acquire(self, key: str) -> bool:
+        """Take the lease on key; False if another run holds it."""
+        path = self.path(key)
+        token = f"{self.owner}:{uuid.uuid4().hex}"
+        for _ in range(3):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileNotFoundError:
+                os.makedirs(self.directory, exist_ok=True)
+                continue
+            except FileExistsError:
+                if not self._expired(path):
+                    return False
+                self._break(path)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(token + "\n")
+            with self._lock:
+                self._held[path] = token
+                if self._heartbeat is None:
+                    self._heartbeat = threading.Thread(target=self._renew, daemon=True)
+                    self._heartbeat.start()
+            return True
+        return False
+
+    def release(self, key: str) -> None:
+        path = self.path(key)
+        with self._lock:
+            token = self._held.pop(path, None)
+        # Leave it alone if it was broken and another run holds it now
+        if token is not None and _read(path) == token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _expired(self, path: str) -> bool:
+        try:
+            return time.time() - os.stat(path).st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def _break(self, path: str) -> None:
+        """Remove an abandoned lease. It is renamed aside first, so that if
+        another run broke it and took it out in the meantime, the new lease
+        can be put back instead of being lost.
+        """
+        stale = _read(path)
+        aside = f"{path}.{uuid.uuid4().hex}.broken"
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return
+        if _read(aside) != stale:
+            try:
+                os.link(aside, path)
+            except OSError:
+                pass
+        os.remove(aside)
+
+    def _renew(self) -> None:
+        while True:
+            time.sleep(self.ttl / 4)
+            with self._lock:
+                paths = list(self._held)
+                if not paths:
+                    self._heartbeat = None
+                    return
+            for path in paths:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+
+def _read(path: str):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from pastpaper.utils import LOG_DIR
+
+LEDGER_PATH = os.path.join(LOG_DIR, "ledger.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    subject TEXT,
+    status TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    bytes INTEGER,
+    duration REAL,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS events_url ON events (url, id);
+CREATE INDEX IF NOT EXISTS events_path ON events (path, id);
+"""
+
+
+class Ledger:
+    """Append-only history of download results in SQLite (WAL mode).
+
+    Every result is one INSERT, so recording stays cheap however long the
+    ledger grows; the latest row for a URL or path is its current status.
+    One connection is shared between threads behind a lock.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = [row["name"] for row in self._db.execute("PRAGMA table_info(events)")]
+        if "sha256" not in columns:
+            # Ledgers written before the content store existed
+            self._db.execute("ALTER TABLE events ADD COLUMN sha256 TEXT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def record(
+        self,
+        subject: str,
+        url: str,
+        path: str,
+        status: str,
+        size: Optional[int] = None,
+        duration: Optional[float] = None,
+        sha256: Optional[str] = None,
+    ) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO events (ts, subject, status, url, path, bytes, duration, sha256)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), subject, status, url, path, size, duration, sha256),
+            )
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def latest(self, url: str) -> Optional[sqlite3.Row]:
+        rows = self._query(
+            "SELECT * FROM events WHERE url = ? ORDER BY id DESC LIMIT 1", (url,)
+        )
+        return rows[0] if rows else None
+
+    def latest_digest(self, url: str) -> Optional[str]:
+        """sha256 of the last content successfully fetched from url, if any."""
+        rows = self._query(
+            "SELECT sha256 FROM events WHERE url = ? AND sha256 IS NOT NULL"
+            " ORDER BY id DESC LIMIT 1",
+            (url,),
+        )
+        return rows[0]["sha256"] if rows else None
+
+    def known_sizes(self) -> dict:
+        """Size in bytes of the last successful download of every URL."""
+        rows = self._query(
+            "SELECT url, bytes FROM events WHERE id IN"
+            " (SELECT MAX(id) FROM events WHERE status = 'SUCCESS' AND bytes IS NOT NULL"
+            " GROUP BY url)"
+        )
+        return {row["url"]: row["bytes"] for row in rows}
+
+    def history(self, url: Optional[str] = None, path: Optional[str] = None) -> List[sqlite3.Row]:
+        if url is not None:
+            return self._query("SELECT * FROM events WHERE url = ? ORDER BY id", (url,))
+        if path is not None:
+            return self._query("SELECT * FROM events WHERE path = ? ORDER BY id", (path,))
+        return self._query("SELECT * FROM events ORDER BY id")
+
+    def tail(self, limit: int = 10) -> List[sqlite3.Row]:
+        rows = self._query("SELECT * FROM events ORDER BY id DESC LIMIT ?", (limit,))
+        return rows[::-1]
+
+    def _latest_rows(self, where: str = "", params=()) -> List[sqlite3.Row]:
+        return self._query(
+            "SELECT * FROM events WHERE id IN"
+            " (SELECT MAX(id) FROM events GROUP BY url, path)" + where + " ORDER BY id",
+            params,
+        )
+
+    def failures(self) -> List[sqlite3.Row]:
+        """Files whose most recent attempt failed."""
+        return self._latest_rows(" AND status = ?", ("FAIL",))
+
+    def summary(self) -> dict:
+        """Count of files by their most recent status."""
+        rows = self._query(
+            "SELECT status, COUNT(*) AS n FROM events WHERE id IN"
+            " (SELECT MAX(id) FROM events GROUP BY url, path) GROUP BY status"
+        )
+        return {row["status"]: row["n"] for row in rows}
+
+    def compact(self, keep_days: Optional[float] = None) -> int:
+        """Drop all but the latest row per (url, path), plus latest rows older
+        than `keep_days` if given, then reclaim the space. Returns rows removed.
+
+        The last row with a digest and the last SUCCESS with a size of each
+        URL always stay, whatever came after them (SKIPPED rows carry
+        neither): store links and size estimates read them.
+        """
+        content = (
+            " SELECT MAX(id) FROM events WHERE sha256 IS NOT NULL GROUP BY url"
+            " UNION SELECT MAX(id) FROM events WHERE status = 'SUCCESS' AND bytes IS NOT NULL"
+            " GROUP BY url"
+        )
+        with self._lock:
+            with self._db:
+                removed = self._db.execute(
+                    "DELETE FROM events WHERE id NOT IN"
+                    " (SELECT MAX(id) FROM events GROUP BY url, path UNION" + content + ")"
+                ).rowcount
+                if keep_days is not None:
+                    cutoff = time.time() - keep_days * 24 * 60 * 60
+                    removed += self._db.execute(
+                        "DELETE FROM events WHERE ts < ? AND id NOT IN (" + content + ")", (cutoff,)
+                    ).rowcount
+            self._db.execute("VACUUM")
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Ledger:
+    """The process-wide ledger at LEDGER_PATH, opened on first use."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger()
+        return _ledger
@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from pastpaper.utils import LOG_DIR
+
+METRICS_DIR = os.path.join(LOG_DIR, "metrics")
+REPORT_FILE = "last_run.json"
+# Picked up by node_exporter's textfile collector if METRICS_DIR is its directory
+PROM_FILE = "pastpaper.prom"
+FINISHED = ("success", "skipped", "failed")
+# 9702_s23_qp_12.pdf -> qp
+KIND_RE = re.compile(r"_([a-z]{2})(?:_\d+)?\.pdf$")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (16384, 65536, 262144, 1048576, 4194304, 16777216)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+# Histogram name -> (buckets, help text)
+HISTOGRAMS = {
+    "wait_seconds": (SECONDS_BUCKETS, "Time a request was held back by the rate limiter"),
+    "connect_seconds": (SECONDS_BUCKETS, "TCP and TLS setup per request, 0 on a reused connection"),
+    "ttfb_seconds": (SECONDS_BUCKETS, "Request sent to response headers in"),
+    "transfer_seconds": (SECONDS_BUCKETS, "Time spent reading the response body"),
+    "response_bytes": (BYTES_BUCKETS, "Body bytes received per request"),
+    "task_seconds": (SECONDS_BUCKETS, "First attempt at a file to its final result"),
+    "task_retries": (RETRY_BUCKETS, "Requests after the first, per file"),
+}
+PHASES = ("wait", "connect", "ttfb", "transfer")
+
+
+def paper_kind(out_path: str) -> str:
+    """qp, ms, er, ... from a paper file name; "other" if it doesn't look like one."""
+    match = KIND_RE.search(os.path.basename(out_path))
+    return match.group(1) if match else "other"
+
+
+class Histogram:
+    """Fixed-bucket histogram, Prometheus style (buckets are upper bounds)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Dict[str, int]:
+        """Count of observations <= each bound, keyed like Prometheus' `le`."""
+        out, total = {}, 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            out[_number(bound)] = total
+        out["+Inf"] = self.count
+        return out
+
+    def to_json(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": self.cumulative(),
+        }
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunMetrics:
+    """Collect per-request timings from the event bus into histograms per
+    subject and paper kind, for an end-of-run report.
+
+    Request events (see scraper.fetch_once) give connect, time to first
+    byte, transfer and bytes. Started events count the attempts at a file
+    and finished-task events close it, giving its retries and total time.
+    Use as a context manager around a run, then write() the report as JSON
+    and as a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.outcomes: Dict[Tuple[str, str, str], int] = {}
+        self.statuses: Dict[Tuple[str, str, str], int] = {}
+        self._tasks = {}  # (url, out_path) -> [first attempt ts, attempts]
+        self._lock = threading.Lock()
+
+    def _observe(self, name: str, subject: str, kind: str, value: float) -> None:
+        key = (name, subject, kind)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(HISTOGRAMS[name][0])
+        histogram.observe(value)
+
+    def __call__(self, event) -> None:
+        if event.kind == "progress":
+            return
+        subject, kind = event.subject, paper_kind(event.out_path)
+        key = (event.url, event.out_path)
+        with self._lock:
+            if event.kind == "started":
+                # Published once per attempt, before anything else about it
+                task = self._tasks.setdefault(key, [event.ts, 0])
+                task[1] += 1
+            elif event.kind == "request" and event.timing is not None:
+                timing = event.timing
+                for phase in PHASES:
+                    self._observe(f"{phase}_seconds", subject, kind, getattr(timing, phase))
+                self._observe("response_bytes", subject, kind, timing.bytes)
+                outcome = (subject, kind, timing.outcome)
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            elif event.kind in FINISHED:
+                status = (subject, kind, event.status)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                task = self._tasks.pop(key, None)
+                if task is not None:
+                    self._observe("task_seconds", subject, kind, event.ts - task[0])
+                    self._observe("task_retries", subject, kind, task[1] - 1)
+
+    def __enter__(self):
+        from pastpaper.events import bus
+
+        bus.subscribe(self)
+        return self
+
+    def __exit__(self, *exc):
+        from pastpaper.events import bus
+
+        bus.unsubscribe(self)
+        self.finished = time.time()
+
+    def totals(self) -> dict:
+        """Run-wide sums: requests, retries, bytes and seconds per phase."""
+        with self._lock:
+            def total(name):
+                return sum(h.sum for (n, _, _), h in self.histograms.items() if n == name)
+
+            return {
+                "requests": sum(self.outcomes.values()),
+                "retries": int(total("task_retries")),
+                "bytes": int(total("response_bytes")),
+                "seconds": {phase: round(total(f"{phase}_seconds"), 3) for phase in PHASES},
+            }
+
+    def to_json(self) -> dict:
+        end = self.finished or time.time()
+        groups = {}
+        with self._lock:
+            for (name, subject, kind), histogram in sorted(self.histograms.items()):
+                group = groups.setdefault((subject, kind), {"subject": subject, "kind": kind})
+                group[name] = histogram.to_json()
+            for key, counts in (("outcomes", self.outcomes), ("statuses", self.statuses)):
+                for (subject, kind, status), n in sorted(counts.items()):
+                    group = groups.setdefault((subject, kind), {"subject": subject, "kind": kind})
+                    group.setdefault(key, {})[status] = n
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed": round(end - self.started, 3),
+            "totals": self.totals(),
+            "groups": list(groups.values()),
+        }
+
+    def to_prometheus(self) -> str:
+        """The report in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (_, help_text) in HISTOGRAMS.items():
+                series = sorted(
+                    (subject, kind, h) for (n, subject, kind), h in self.histograms.items() if n == name
+                )
+                if not series:
+                    continue
+                metric = f"pastpaper_{name}"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for subject, kind, histogram in series:
+                    labels = f'subject="{_label(subject)}",kind="{kind}"'
+                    for bound, n in histogram.cumulative().items():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {n}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+            for name, counts, label, help_text in (
+                ("requests_total", self.outcomes, "outcome", "Requests by outcome"),
+                ("files_total", self.statuses, "status", "Finished files by status"),
+            ):
+                if not counts:
+                    continue
+                metric = f"pastpaper_{name}"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for (subject, kind, status), n in sorted(counts.items()):
+                    lines.append(
+                        f'{metric}{{subject="{_label(subject)}",kind="{kind}",{label}="{status}"}} {n}'
+                    )
+        end = self.finished or time.time()
+        lines += [
+            "# HELP pastpaper_run_seconds Duration of the last run",
+            "# TYPE pastpaper_run_seconds gauge",
+            f"pastpaper_run_seconds {end - self.started:.3f}",
+            "# HELP pastpaper_run_finished_timestamp_seconds When the last run ended",
+            "# TYPE pastpaper_run_finished_timestamp_seconds gauge",
+            f"pastpaper_run_finished_timestamp_seconds {end:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Optional[str] = None) -> Tuple[str, str]:
+        """Write the JSON report and the Prometheus textfile into `directory`
+        (METRICS_DIR by default), replacing the last run's; returns both paths.
+        """
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, text in (
+            (REPORT_FILE, json.dumps(self.to_json(), indent=2)),
+            (PROM_FILE, self.to_prometheus()),
+        ):
+            path = os.path.join(directory, name)
+            # Scrapers must never see a half-written file
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            paths.append(path)
+        return tuple(paths)
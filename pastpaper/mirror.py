@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+from pastpaper.batch import (
+    DEFAULT_ROOT,
+    KINDS,
+    Shard,
+    expand_levels,
+    expand_sessions,
+    expand_subjects,
+    expand_years,
+    run_tasks_headless,
+    subject_dir,
+)
+from pastpaper.cache import JsonStore, session_is_recent
+from pastpaper.utils import LOG_DIR
+
+CHECKPOINT_DIR = os.path.join(LOG_DIR, "mirror")
+DEFAULT_SINCE = 2015
+# Seconds between checkpoint writes while a mirror is running
+SAVE_INTERVAL = 5.0
+# A folder counts as incomplete if any of its files ended like this
+UNFINISHED = ("FAIL", "CANCELLED")
+
+
+class Checkpoint(JsonStore):
+    """Which level/subject/20YY-Session folders a mirror of `root` has fully
+    fetched, keyed "A-Level/<subject slug>/<session folder>". Each shard of
+    a split mirror keeps its own.
+    """
+
+    def __init__(self, root: str, path: Optional[str] = None, shard: Optional[Shard] = None):
+        root = os.path.abspath(os.path.expanduser(root))
+        key = hashlib.sha1(root.encode()).hexdigest()[:16]
+        if shard is not None:
+            key += f"-{shard.index}of{shard.count}"
+        super().__init__(path or os.path.join(CHECKPOINT_DIR, f"{key}.json"))
+
+    def is_complete(self, folder: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(folder)
+        return bool(entry and entry["complete"])
+
+    def mark(self, folder: str, complete: bool, files: int) -> None:
+        with self._lock:
+            self._entries[folder] = {"complete": complete, "files": files, "ts": time.time()}
+            self._dirty = True
+
+    def counts(self) -> Tuple[int, int]:
+        """(complete, incomplete) folder counts."""
+        with self._lock:
+            complete = sum(entry["complete"] for entry in self._entries.values())
+            return complete, len(self._entries) - complete
+
+
+class _Tracker:
+    """Follow each folder's tasks through the engine and checkpoint the
+    folder once its last result is in.
+
+    A folder is complete when its listing was read (a folder that lists no
+    papers is complete too), none of its files failed or were cancelled, and its session is old enough that no more
+    papers are expected (see cache.session_is_recent).
+    """
+
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self.checked = 0
+        self._folders = {}  # folder -> [outstanding, unfinished, emitted, listed, files]
+        self._tasks = {}  # out_path -> folder, while in flight
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+
+    def add(self, folder: str, out_path: str) -> None:
+        with self._lock:
+            state = self._folders.setdefault(folder, [0, 0, False, True, 0])
+            state[0] += 1
+            state[4] += 1
+            self._tasks[out_path] = folder
+
+    def emitted(self, folder: str, listed: bool) -> None:
+        with self._lock:
+            state = self._folders.setdefault(folder, [0, 0, False, True, 0])
+            state[2], state[3] = True, listed
+            self._settle(folder, state)
+
+    def on_result(self, result) -> None:
+        with self._lock:
+            folder = self._tasks.pop(result.out_path, None)
+            if folder is None:
+                return
+            state = self._folders[folder]
+            state[0] -= 1
+            if result.status in UNFINISHED:
+                state[1] += 1
+            self._settle(folder, state)
+
+    def _settle(self, folder: str, state: list) -> None:
+        outstanding, unfinished, emitted, listed, files = state
+        if not emitted or outstanding:
+            return
+        del self._folders[folder]
+        complete = listed and not unfinished and not session_is_recent(f"/{folder}/")
+        self.checkpoint.mark(folder, complete, files)
+        self.checked += 1
+        if time.monotonic() - self._saved > SAVE_INTERVAL:
+            self.checkpoint.save()
+            self._saved = time.monotonic()
+
+
+def mirror_tasks(
+    root: str, years, tracker: _Tracker, full: bool = False, shard: Optional[Shard] = None
+) -> Iterator[Tuple[str, str]]:
+    """Every paper of every subject, level, session and kind in `years`,
+    leaving out folders the checkpoint has as complete unless `full`, and
+    with a `shard`, folders of other shards.
+    """
+    from pastpaper.scraper import iter_download_tasks
+
+    sessions = expand_sessions("all")
+    checkpoint = tracker.checkpoint
+    for name, code, slug in expand_subjects("all"):
+        for level_slug in expand_levels("both"):
+            prefix = f"{level_slug}/{slug}/"
+
+            def want(session_folder, prefix=prefix):
+                folder = prefix + session_folder
+                if shard is not None and not shard.owns(folder):
+                    return False
+                return full or not checkpoint.is_complete(folder)
+
+            def done(session_folder, listed, count, prefix=prefix):
+                tracker.emitted(prefix + session_folder, listed)
+
+            for url, out_path in iter_download_tasks(
+                code,
+                slug,
+                level_slug,
+                KINDS,
+                [session[0] for session in sessions],
+                [session[1] for session in sessions],
+                years,
+                None,
+                subject_dir(root, name, code),
+                want_folder=want,
+                on_folder=done,
+            ):
+                # out_dir/<session folder>/<kind>/<file>
+                session_folder = os.path.basename(os.path.dirname(os.path.dirname(out_path)))
+                tracker.add(prefix + session_folder, out_path)
+                yield url, out_path
+
+
+def run_mirror(
+    root: Optional[str] = None,
+    since: Optional[int] = None,
+    full: bool = False,
+    workers: int = 8,
+    revalidate: bool = False,
+    progress: bool = True,
+    shard: Optional[Shard] = None,
+) -> dict:
+    """Bring the local copy of the whole catalog under `root` up to date.
+
+    Only session folders from `since` (default DEFAULT_SINCE) onwards that
+    aren't checkpointed as complete are listed and fetched (all of them
+    with `full`). The checkpoint is written as folders finish and when the
+    run ends, even if it is interrupted, so the next run picks up where
+    this one stopped.
+    With a `shard`, only its share of the folders is mirrored, so N runs
+    (shards 1/N to N/N) on any machines sharing `root` split the catalog.
+    """
+    root = os.path.expanduser(root or DEFAULT_ROOT)
+    checkpoint = Checkpoint(root, shard=shard)
+    tracker = _Tracker(checkpoint)
+    years = expand_years(f"{since or DEFAULT_SINCE}-{time.localtime().tm_year}")
+    try:
+        summary = run_tasks_headless(
+            mirror_tasks(root, years, tracker, full=full, shard=shard),
+            workers=workers,
+            revalidate=revalidate,
+            progress=progress,
+            root=root,
+            on_result=tracker.on_result,
+        )
+    finally:
+        checkpoint.save()
+    if shard is not None:
+        summary["shard"] = f"{shard.index}/{shard.count}"
+    complete, incomplete = checkpoint.counts()
+    summary["folders"] = {
+        "checked": tracker.checked,
+        "complete": complete,
+        "incomplete": incomplete,
+    }
+    return summary
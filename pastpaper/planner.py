@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Task = Tuple[str, str]  # (url, out_path)
+
+
+class Plan:
+    """What a run would do, worked out without writing anything.
+
+    `tasks` is the deduplicated task list to hand to the engine. The local
+    state of each task comes from an inventory.Inventory (present, corrupt
+    or missing) and `sizes` holds the expected size, in bytes, of the files
+    to download, where known.
+    """
+
+    def __init__(
+        self,
+        tasks: List[Task],
+        duplicates: int = 0,
+        present: Optional[List[Task]] = None,
+        corrupt: Optional[List[Task]] = None,
+        sizes: Optional[Dict[str, int]] = None,
+    ):
+        self.tasks = tasks
+        self.duplicates = duplicates
+        self.present = present or []
+        self.corrupt = corrupt or []
+        self.sizes = sizes or {}
+
+    def __len__(self):
+        return len(self.tasks)
+
+    @property
+    def to_download(self) -> List[Task]:
+        present = {out_path for _, out_path in self.present}
+        return [task for task in self.tasks if task[1] not in present]
+
+    @property
+    def expected_bytes(self) -> int:
+        return sum(self.sizes.get(url, 0) for url, _ in self.to_download)
+
+    def summary(self) -> dict:
+        to_download = self.to_download
+        return {
+            "tasks": len(self.tasks),
+            "duplicates": self.duplicates,
+            "present": len(self.present),
+            "corrupt": len(self.corrupt),
+            "to_download": len(to_download),
+            "expected_bytes": self.expected_bytes,
+            "sizes_known": sum(url in self.sizes for url, _ in to_download),
+        }
+
+    def describe(self) -> List[str]:
+        """The summary as lines of text, for the dry run."""
+        s = self.summary()
+        lines = [f"{s['tasks']} files selected"]
+        if s["duplicates"]:
+            lines[0] += f" ({s['duplicates']} duplicates dropped)"
+        lines.append(f"{s['present']} already downloaded")
+        if s["corrupt"]:
+            lines.append(f"{s['corrupt']} damaged, to download again")
+        size = f"{s['expected_bytes'] / 1024 / 1024:.1f} MiB"
+        if s["sizes_known"] < s["to_download"]:
+            size = f"at least {size} ({s['sizes_known']} of {s['to_download']} sizes known)"
+        lines.append(f"{s['to_download']} to download, {size}")
+        return lines
+
+
+def head_sizes(urls: Iterable[str], workers: int = 8, timeout: int = 15) -> Dict[str, int]:
+    """Content-Length of each URL from HEAD requests; unanswered ones are left out."""
+    from pastpaper.scraper import get_session
+
+    def size(url):
+        try:
+            r = get_session().head(url, timeout=timeout, allow_redirects=True)
+        except Exception:
+            return None
+        length = r.headers.get("Content-Length", "")
+        return int(length) if r.status_code == 200 and length.isdigit() else None
+
+    urls = list(urls)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return {url: n for url, n in zip(urls, pool.map(size, urls)) if n is not None}
+
+
+def make_plan(
+    tasks: Iterable[Task],
+    inventory=None,
+    head: bool = False,
+    workers: int = 8,
+) -> Plan:
+    """Deduplicate tasks by out_path and work out what is left to fetch.
+
+    Local state comes from `inventory` (scanned, not saved). Sizes come
+    from the ledger for URLs downloaded before, and, with `head`, from HEAD
+    requests for the rest.
+    """
+    from pastpaper.ledger import get_ledger
+
+    unique = {}
+    duplicates = 0
+    for url, out_path in tasks:
+        if out_path in unique:
+            duplicates += 1
+        else:
+            unique[out_path] = url
+    tasks = [(url, out_path) for out_path, url in unique.items()]
+
+    present, corrupt = [], []
+    if inventory is not None:
+        split = inventory.diff(tasks)
+        present, corrupt = split["ok"], split["corrupt"]
+
+    plan = Plan(tasks, duplicates, present, corrupt)
+    known = get_ledger().known_sizes()
+    plan.sizes = {url: known[url] for url, _ in plan.to_download if url in known}
+    if head:
+        unknown = [url for url, _ in plan.to_download if url not in plan.sizes]
+        plan.sizes.update(head_sizes(unknown, workers=workers))
+    return plan
@@ -0,0 +1,122 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Pause applied on 429/503 when the server doesn't say how long to wait
+DEFAULT_BACKOFF = 5.0
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, in bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Rate and concurrency limit shared by every download worker.
+
+    Requests take a token from a TokenBucket and one of `limit` concurrency
+    slots. The limit grows additively while responses come back healthy and
+    quick, and shrinks multiplicatively on errors, slow responses and
+    throttling (AIMD). A 429/503 also halves the request rate and pauses
+    every worker for the Retry-After period.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        rate: float = 20.0,
+        max_rate: float = 100.0,
+        min_rate: float = 0.5,
+        target_latency: float = 2.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.target_latency = target_latency
+        self.bucket = TokenBucket(rate, capacity=max(1.0, rate))
+        self._limit = float(max(self.min_concurrency, self.max_concurrency // 2))
+        self._active = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._active >= int(self._limit):
+                    self._cond.wait()
+                else:
+                    break
+            self._active += 1
+        self.bucket.acquire()
+
+    def release(
+        self,
+        status: int | None,
+        latency: float = 0.0,
+        retry_after: float | None = None,
+    ) -> None:
+        """Give the slot back and adapt to how the request went. `status` is
+        None for timeouts and connection errors; `latency` is the time to the
+        response headers.
+        """
+        with self._cond:
+            self._active -= 1
+            if status in THROTTLE_STATUSES:
+                self._limit = max(self.min_concurrency, self._limit / 2)
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+                pause = retry_after if retry_after is not None else DEFAULT_BACKOFF
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            elif status is None or status >= 500:
+                self._limit = max(self.min_concurrency, self._limit * 0.75)
+            elif latency > self.target_latency:
+                self._limit = max(self.min_concurrency, self._limit - 1)
+            else:
+                # About +1 slot per `limit` healthy responses
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + 0.25)
+            self._cond.notify_all()
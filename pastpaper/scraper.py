@@ -1,22 +1,206 @@
+import hashlib
 import logging
 import os
+import re
+import threading
 import time
 import urllib.parse
-from typing import Iterable, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Tuple
 
 import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
-logging.basicConfig(
-    filename='pastpaper.log',
-    level=logging.ERROR,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from pastpaper.events import STATUS_EVENTS, RequestTiming, bus
+from pastpaper.ratelimit import THROTTLE_STATUSES, parse_retry_after
+from pastpaper.utils import enable_error_log
 
-BASE_API = "https://pastpapers.co/api/file"
+# The server can be overridden with PASTPAPER_SERVER or configure(), e.g. to
+# point at a local pastpaper.fakeserver for benchmarks
+DEFAULT_SERVER = "https://pastpapers.co"
+BASE_API = f"{DEFAULT_SERVER}/api/file"
 BOARD = "caie"
+# Human-facing folder browser; lists the files of ?dir=<level>/<subject>/<session>
+BASE_LISTING = f"{DEFAULT_SERVER}/cie/"
+
+CHUNK_SIZE = 8192
+# Publish a progress event every this many bytes of a body
+PROGRESS_STEP = 256 * 1024
+# Session folder listings fetched ahead of the one being turned into tasks
+LISTING_LOOKAHEAD = 4
+PDF_MAGIC = b"%PDF"
+PDF_TRAILER = b"%%EOF"
+# Readers accept the %%EOF marker anywhere in the last KiB of the file
+TRAILER_WINDOW = 1024
+# Kept next to a partial body: the ETag (or Last-Modified) it was served with
+VALIDATOR_SUFFIX = ".validator"
+
+# e.g. 9702_s23_qp_12.pdf, 9702_s23_gt.pdf
+PAPER_FILE_RE = re.compile(r"\d{4}_[msw]\d{2}_[a-z]{2}(?:_\d+)?\.pdf")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": "https://pastpapers.co/",
+    "Accept": "application/pdf,*/*",
+    # Content-Length and Range offsets must count the bytes that are stored
+    "Accept-Encoding": "identity",
+}
+
+_session = None
+_pool_size = 0  # connections per host in the shared session's pool
+_session_lock = threading.Lock()
+# Seconds the current thread has spent opening connections since the last
+# take_connect_time(); requests are made on the thread that asked for them
+_connect_time = threading.local()
+
+
+def _add_connect_time(start: float) -> None:
+    _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - start
+
+
+def take_connect_time() -> float:
+    """Connection setup time on this thread since the last call, and reset it."""
+    seconds = getattr(_connect_time, "seconds", 0.0)
+    _connect_time.seconds = 0.0
+    return seconds
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connect_time(start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections record how long connecting took
+    (TCP and TLS), for take_connect_time().
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def open_session(pool_size: int = 8) -> requests.Session:
+    """Open the shared keep-alive session, or return it if already open.
+    The connection pool holds `pool_size` connections per host, which should
+    match the number of download workers; a session already open with a
+    smaller pool gets a larger one.
+    """
+    global _session, _pool_size
+    pool_size = max(1, pool_size)
+    with _session_lock:
+        if _session is None:
+            enable_error_log()
+            _session = requests.Session()
+            _session.headers.update(DEFAULT_HEADERS)
+            _pool_size = 0
+        if pool_size > _pool_size:
+            # e.g. get_session() opened it with the default for a catalog
+            # lookup before the run asked for one connection per worker
+            old = _session.adapters.get("https://")
+            adapter = TimedAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            if old is not None:
+                # Only idle connections are closed; requests in flight finish
+                old.close()
+            _pool_size = pool_size
+        return _session
+
+
+def get_session() -> requests.Session:
+    return _session or open_session()
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+@contextmanager
+def http_session(pool_size: int = 8):
+    session = open_session(pool_size)
+    try:
+        yield session
+    finally:
+        close_session()
+
+
+def configure(
+    server: str | None = None,
+    base_api: str | None = None,
+    base_listing: str | None = None,
+    board: str | None = None,
+) -> None:
+    """Point downloads at another server. `server` sets both the file API
+    and the listing URL from its root; the others override one at a time.
+    """
+    global BASE_API, BASE_LISTING, BOARD
+    if server:
+        server = server.rstrip("/")
+        BASE_API, BASE_LISTING = f"{server}/api/file", f"{server}/cie/"
+    BASE_API = base_api or BASE_API
+    BASE_LISTING = base_listing or BASE_LISTING
+    BOARD = board or BOARD
 
 
+configure(
+    server=os.environ.get("PASTPAPER_SERVER"),
+    base_api=os.environ.get("PASTPAPER_BASE_API"),
+    base_listing=os.environ.get("PASTPAPER_BASE_LISTING"),
+    board=os.environ.get("PASTPAPER_BOARD"),
+)
+
+
+class InvalidPDF(Exception):
+    """The response body is not a PDF (e.g. an HTML error page served as 200)."""
+
+
+class IncompleteDownload(requests.RequestException):
+    """The body ended before the advertised length or the PDF trailer."""
+
+
+def subject_from_url(url: str) -> str:
+    """Return the subject folder of an API file URL, or 'unknown'."""
+    # URL format: .../file/BOARD/level/subject_slug/...
+    parts = url.split('/')
+    if len(parts) > 7:
+        return urllib.parse.unquote(parts[7])
+    return 'unknown'
+
 
 def scrape_subject(
     subject_code: str,
@@ -28,101 +212,218 @@ def scrape_subject(
     paper_numbers: Iterable[str] | None = None,
     retries: int = 3,
     timeout: int = 15,
+    workers: int = 8,
+    use_negative_cache: bool = True,
+    revalidate: bool = False,
 ):
+    from pastpaper.cache import MetadataStore, NegativeCache
+    from pastpaper.catalog import get_catalog
+    from pastpaper.engine import DownloadEngine
+    from pastpaper.events import enable_file_log
+    from pastpaper.inventory import Inventory
+    from pastpaper.metrics import RunMetrics
+    from pastpaper.store import BlobStore
+
+    from pastpaper.subjects import SESSIONS
+
     if isinstance(session_code, str):
         session_code = [session_code]
     if isinstance(year_code, str):
         year_code = [year_code]
 
-    os.makedirs(out_dir, exist_ok=True)
+    # The site's folder name for the subject comes from the cached catalog
+    level_slug = level
+    subject_slug = get_catalog().slug(subject_code, level_slug)
+    # Files are named by session code ("s"), folders by name ("May-June")
+    folder_names = {code: slug for _, code, slug in SESSIONS.values()}
+    unknown = [code for code in session_code if code not in folder_names]
+    if unknown:
+        raise ValueError(f"unknown session code: {', '.join(unknown)}")
 
-    # Infer slugs if not provided (for backward compatibility of this helper)
-    # This is a simplified fallback; for full control, use the CLI or direct build_download_tasks
-    subject_slug = f"Subject-{subject_code}" 
-    level_slug = level 
-    
-    tasks = build_download_tasks(
+    tasks = iter_download_tasks(
         subject_code,
         subject_slug,
         level_slug,
         paper_type,
-        session_code if isinstance(session_code, list) else [session_code],
-        [session_code] if isinstance(session_code, str) else session_code, # Fallback name
-        year_code if isinstance(year_code, list) else [year_code],
+        session_code,
+        [folder_names[code] for code in session_code],
+        year_code,
         paper_numbers,
         out_dir,
     )
 
-    if not tasks:
-        print("no matching papers found")
-        return
-
-    with tqdm(tasks, desc="downloading", unit="file") as bar:
-        for url, out_path in bar:
-            if os.path.exists(out_path):
-                bar.set_postfix_str("skipped")
-                # Extract subject from URL for logging
-                subject = 'unknown'
-                try: parts = url.split('/'); subject = parts[5] if len(parts) > 5 else 'unknown'
-                except: pass
-                log_download_status(subject, url, out_path, "SKIPPED")
-                continue
-
-            success = download_with_retry(
-                url,
-                out_path,
-                retries=retries,
-                timeout=timeout,
+    enable_file_log()
+    # Subject folders sit side by side, so they share the store
+    store = BlobStore(os.path.dirname(os.path.abspath(out_dir)))
+    engine = DownloadEngine(
+        workers=workers,
+        retries=retries,
+        timeout=timeout,
+        negative_cache=NegativeCache() if use_negative_cache else None,
+        metadata=MetadataStore(),
+        revalidate=revalidate,
+        store=store,
+        inventory=Inventory(out_dir, store),
+    )
+    # Downloads start while later folders are still being listed
+    with RunMetrics() as metrics, http_session(workers), tqdm(desc="downloading", unit="file") as bar:
+        def on_result(result):
+            bar.update(1)
+            bar.set_postfix_str(
+                {"SUCCESS": "ok", "LINKED": "linked", "SKIPPED": "skipped", "MISSING": "missing", "NOT_MODIFIED": "unchanged"}.get(result.status, "failed")
             )
 
-            bar.set_postfix_str("ok" if success else "failed")
+        engine.run(tasks, on_result=on_result)
+    metrics.write()
+    if not bar.n:
+        print("no matching papers found")
 
 
 def build_download_tasks(
     subject_code: str,
     subject_slug: str,
     level_slug: str,
-    selected_type: str,
+    selected_type: str | List[str],
     session_codes: List[str],
     session_slugs: List[str],
     years: List[str],
     paper_numbers: Iterable[str] | None,
     out_dir: str,
+    use_listing: bool = True,
 ):
-    tasks = []
-    
-    # Map 'all' or specific types
-    types_to_look_for = []
+    """Build (url, out_path) tasks for every year, session and paper kind.
+    With use_listing, each 20YY-Session folder listing is fetched once and
+    only files that actually exist are emitted; folders whose listing can't
+    be read fall back to probing every paper number.
+    """
+    return list(
+        iter_download_tasks(
+            subject_code,
+            subject_slug,
+            level_slug,
+            selected_type,
+            session_codes,
+            session_slugs,
+            years,
+            paper_numbers,
+            out_dir,
+            use_listing,
+        )
+    )
+
+
+def iter_download_tasks(
+    subject_code: str,
+    subject_slug: str,
+    level_slug: str,
+    selected_type: str | List[str],
+    session_codes: List[str],
+    session_slugs: List[str],
+    years: List[str],
+    paper_numbers: Iterable[str] | None,
+    out_dir: str,
+    use_listing: bool = True,
+    want_folder: Callable[[str], bool] | None = None,
+    on_folder: Callable[[str, bool, int], None] | None = None,
+) -> Iterator[Tuple[str, str]]:
+    """Lazy build_download_tasks: yields each folder's tasks as soon as its
+    listing arrives. Up to LISTING_LOOKAHEAD listings are fetched ahead
+    in the background, so the next folders are ready when they're reached.
+    Folders for which `want_folder(session_folder)` is false are left out.
+    After a folder's last task, `on_folder(session_folder, listed, count)`
+    is called; `listed` is false if its listing couldn't be read.
+    """
+    types_to_look_for = paper_kinds(selected_type)
+    paper_numbers = list(paper_numbers) if paper_numbers else None
+    folders = [
+        (f"20{year}-{session_name}", f"{subject_code}_{session_code}{year}")
+        for year in years
+        for session_code, session_name in zip(session_codes, session_slugs)
+        if want_folder is None or want_folder(f"20{year}-{session_name}")
+    ]
+
+    def listing_of(session_folder):
+        if not use_listing:
+            return None
+        return fetch_session_listing(level_slug, subject_slug, session_folder)
+
+    def tasks_in(session_folder, prefix, listing):
+        listing = listing.result()
+        count = 0
+        for kind in types_to_look_for:
+            for task in discover_files(
+                subject_slug,
+                level_slug,
+                session_folder,
+                prefix,
+                kind,
+                paper_numbers,
+                out_dir,
+                listing=listing,
+            ):
+                count += 1
+                yield task
+        if on_folder is not None:
+            on_folder(session_folder, listing is not None, count)
+
+    with ThreadPoolExecutor(max_workers=LISTING_LOOKAHEAD) as pool:
+        ahead = deque()
+        for session_folder, prefix in folders:
+            ahead.append((session_folder, prefix, pool.submit(listing_of, session_folder)))
+            if len(ahead) >= LISTING_LOOKAHEAD:
+                yield from tasks_in(*ahead.popleft())
+        while ahead:
+            yield from tasks_in(*ahead.popleft())
+
+
+def paper_kinds(selected_type: str | List[str]) -> List[str]:
+    """Map a PAPER_TYPES entry (or a list of kinds) to the file kinds to fetch."""
+    if not isinstance(selected_type, str):
+        return list(selected_type)
     if selected_type == "all":
-        types_to_look_for = ["qp", "ms", "in", "er", "gt"]
+        return ["qp", "ms", "in", "er", "gt"]
     elif "both" in selected_type:
-        types_to_look_for = ["qp", "ms"]
+        return ["qp", "ms"]
     elif " (insert)" in selected_type:
-        types_to_look_for = ["in"]
+        return ["in"]
     elif " (examiner report)" in selected_type:
-        types_to_look_for = ["er"]
+        return ["er"]
     elif " (grade threshold)" in selected_type:
-        types_to_look_for = ["gt"]
-    else:
-        types_to_look_for = [selected_type]
-
-    for year in years:
-        for session_code, session_name in zip(session_codes, session_slugs):
-            session_folder = f"20{year}-{session_name}"
-            prefix = f"{subject_code}_{session_code}{year}"
-
-            for kind in types_to_look_for:
-                tasks += discover_files(
-                    subject_slug,
-                    level_slug,
-                    session_folder,
-                    prefix,
-                    kind,
-                    paper_numbers,
-                    out_dir,
-                )
+        return ["gt"]
+    return [selected_type]
 
-    return tasks
+
+def parse_listing(html: str) -> set:
+    """Return the paper file names linked from a folder listing page."""
+    soup = BeautifulSoup(html, "lxml")
+    names = set()
+    for a in soup.find_all("a"):
+        for candidate in (a.get("href", ""), a.get_text()):
+            match = PAPER_FILE_RE.search(urllib.parse.unquote(candidate))
+            if match:
+                names.add(match.group(0))
+    return names
+
+
+def fetch_session_listing(
+    level_slug: str, subject_slug: str, session_folder: str, timeout: int = 15
+) -> set | None:
+    """Fetch the file names in one 20YY-Session folder.
+    An empty set means the folder lists no papers (e.g. a session the
+    syllabus doesn't sit). Returns None when the listing can't be fetched,
+    so callers can fall back to probing paper numbers.
+    """
+    params = {"dir": f"{level_slug}/{subject_slug}/{session_folder}"}
+    try:
+        with get_session().get(BASE_LISTING, params=params, timeout=timeout) as r:
+            if r.status_code != 200:
+                logging.error(f"Listing unavailable ({r.status_code}): {session_folder}")
+                return None
+            html = r.text
+    except requests.RequestException as e:
+        logging.error(f"Listing request error for {session_folder}: {e}")
+        return None
+    return parse_listing(html)
 
 
 def discover_files(
@@ -133,25 +434,32 @@ def discover_files(
     kind: str,
     paper_numbers: Iterable[str] | None,
     out_dir: str,
+    listing: set | None = None,
 ):
     results = []
 
     # URL‑encode the subject slug to handle spaces but keep parentheses literal as per website spec
     encoded_subject_slug = urllib.parse.quote(subject_slug, safe='()')
 
-    for paper in paper_numbers or [
-        "11",
-        "12",
-        "13",
-        "21",
-        "22",
-        "23",
-        "31",
-        "32",
-        "33",
-    ]:
-        filename = f"{prefix}_{kind}_{paper}.pdf"
+    if listing is not None:
+        filenames = _listed_files(listing, prefix, kind, paper_numbers)
+    else:
+        filenames = [
+            f"{prefix}_{kind}_{paper}.pdf"
+            for paper in paper_numbers or [
+                "11",
+                "12",
+                "13",
+                "21",
+                "22",
+                "23",
+                "31",
+                "32",
+                "33",
+            ]
+        ]
 
+    for filename in filenames:
         url = (
             f"{BASE_API}/"
             f"{BOARD}/"
@@ -168,90 +476,399 @@ def discover_files(
             kind,
             filename,
         )
-
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
         results.append((url, out_path))
 
     return results
 
-def log_download_status(subject: str, url: str, out_path: str, status: str) -> None:
-    """Append a log entry for each download attempt.
-    Status can be SUCCESS, FAIL, or SKIPPED.
-    The log is stored in ~/pastpaper_logs/download_status.log.
-    If status is SUCCESS, we remove any previous FAIL entries for this same file.
-    """
-    log_dir = os.path.expanduser('~/pastpaper_logs')
-    os.makedirs(log_dir, exist_ok=True)
-    log_path = os.path.join(log_dir, 'download_status.log')
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
 
-    # If success, clean up previous failures for this file to keep the log tidy
-    if status == "SUCCESS" and os.path.exists(log_path):
-        try:
-            with open(log_path, 'r') as f:
-                lines = f.readlines()
-            
-            # Filter out any FAIL lines that match this specific URL and path
-            new_lines = [
-                line for line in lines 
-                if not (f" | FAIL | " in line and url in line and out_path in line)
-            ]
-            
-            if len(new_lines) < len(lines):
-                with open(log_path, 'w') as f:
-                    f.writelines(new_lines)
-        except Exception:
-            pass # Silently fail if log cleanup issues occur
+def _listed_files(
+    listing: set, prefix: str, kind: str, paper_numbers: Iterable[str] | None
+) -> List[str]:
+    wanted = set(paper_numbers) if paper_numbers else None
+    filenames = []
+    for name in sorted(listing):
+        stem = name[:-len(".pdf")]
+        if stem == f"{prefix}_{kind}":
+            # Per-session files such as examiner reports and grade thresholds
+            filenames.append(name)
+        elif stem.startswith(f"{prefix}_{kind}_"):
+            paper = stem[len(f"{prefix}_{kind}_"):]
+            if wanted is None or paper in wanted:
+                filenames.append(name)
+    return filenames
 
-    with open(log_path, 'a') as f:
-        f.write(f"{timestamp} | {subject} | {status} | {url} -> {out_path}\n")
+
+def log_download_status(
+    subject: str,
+    url: str,
+    out_path: str,
+    status: str,
+    size: int | None = None,
+    duration: float | None = None,
+    sha256: str | None = None,
+) -> None:
+    """Record a download attempt in the ledger and publish it on the event bus.
+    Status can be SUCCESS, LINKED, FAIL, SKIPPED, NOT_MODIFIED or MISSING.
+    The ledger (see pastpaper.ledger) keeps the full history with byte
+    counts and durations; the plain-text ~/pastpaper_logs/download_status.log
+    is written by an optional bus sink (see events.enable_file_log).
+    """
+    from pastpaper.ledger import get_ledger
+
+    get_ledger().record(
+        subject, url, out_path, status, size=size, duration=duration, sha256=sha256
+    )
+    bus.publish(STATUS_EVENTS[status], url, out_path, subject=subject, status=status, size=size)
 
 
 def download_with_retry(url: str, out_path: str, retries: int = 3, timeout: int = 60) -> bool:
     """Download a file with retries and log the outcome.
     The subject is inferred from the URL for logging purposes.
+    Requests go through the shared keep-alive session (see open_session).
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Referer": "https://pastpapers.co/",
-        "Accept": "application/pdf,*/*",
-    }
-    # Attempt to extract subject slug from URL for logging
-    subject = 'unknown'
-    try:
-        parts = url.split('/')
-        # URL format: .../file/BOARD/level/subject_slug/...
-        subject = parts[7] if len(parts) > 7 else 'unknown'
-    except Exception:
-        pass
+    return download_file(url, out_path, retries=retries, timeout=timeout) == "SUCCESS"
+
+
+class Attempt(NamedTuple):
+    """Outcome of one request for a file (see fetch_once)."""
+    status: str  # SUCCESS, NOT_MODIFIED, MISSING or FAIL
+    # For FAIL: timeout, connection, incomplete, server, throttled or invalid
+    error: str | None = None
+    retry_after: float | None = None
+    etag: str | None = None
+
+
+def download_file(
+    url: str,
+    out_path: str,
+    retries: int = 3,
+    timeout: int = 60,
+    metadata=None,
+    conditional: bool = False,
+    limiter=None,
+    store=None,
+) -> str:
+    """Like download_with_retry, but return the outcome: SUCCESS, MISSING
+    (the server answered 404), NOT_MODIFIED or FAIL.
+    Attempts are made with fetch_once, sleeping in between.
+    """
+    subject = subject_from_url(url)
+    etag = None
     for attempt in range(1, retries + 1):
-        try:
-            r = requests.get(url, headers=headers, timeout=timeout, stream=True)
-            if r.status_code == 200:
-                with open(out_path, 'wb') as f:
-                    for chunk in r.iter_content(8192):
-                        if chunk:
-                            f.write(chunk)
-                # sanity check
-                with open(out_path, 'rb') as f:
-                    if f.read(4) == b"%PDF":
-                        log_download_status(subject, url, out_path, "SUCCESS")
-                        return True
-                os.remove(out_path)
-                logging.error(f"Invalid PDF (sanity check failed): {url}")
-                log_download_status(subject, url, out_path, "FAIL")
-                return False
+        result = fetch_once(
+            url,
+            out_path,
+            timeout=timeout,
+            metadata=metadata,
+            conditional=conditional,
+            limiter=limiter,
+            etag=etag,
+            store=store,
+        )
+        if result.status != "FAIL":
+            return result.status
+        if result.error == "invalid":
+            break
+        etag = result.etag
+        if attempt == retries:
+            break
+        if result.error == "throttled":
+            if limiter is None:
+                # Otherwise the limiter pauses every worker for Retry-After
+                time.sleep(result.retry_after if result.retry_after is not None else 2 * attempt)
+        else:
+            time.sleep(2 * attempt)
+    log_download_status(subject, url, out_path, "FAIL")
+    return "FAIL"
+
+
+def fetch_once(
+    url: str,
+    out_path: str,
+    timeout: int = 60,
+    metadata=None,
+    conditional: bool = False,
+    limiter=None,
+    etag: str | None = None,
+    store=None,
+) -> Attempt:
+    """Make a single request for url and classify the outcome.
+
+    Validators of successful downloads are recorded in `metadata` (a
+    cache.MetadataStore). With `conditional`, the request carries the
+    recorded validators for the existing out_path and a 304 leaves it alone.
+    The body streams into out_path + ".part", which later attempts (and later
+    runs) resume with a Range request, guarded by If-Range with the ETag or
+    Last-Modified the partial body was served with (kept beside it, or
+    `etag` from the previous Attempt); a partial body without one is
+    dropped. It is renamed over out_path only once complete and checked,
+    so out_path is never left truncated.
+    With a `store` (a store.BlobStore), the partial body lives in the store
+    instead and the finished file is committed as a blob that out_path
+    links to. Either way its sha256 is computed on the way in and recorded
+    in the ledger.
+    The request waits on `limiter` (a ratelimit.AdaptiveLimiter) if given,
+    and reports its status and latency back to it.
+
+    SUCCESS, NOT_MODIFIED and MISSING are logged here; a FAIL is left to
+    the caller, which decides whether to try again.
+
+    A "request" event with its RequestTiming (connect, time to first byte,
+    transfer, bytes) is published for every attempt, for metrics.RunMetrics.
+    """
+    subject = subject_from_url(url)
+    clock = _RequestClock()
+    take_connect_time()
+    attempt = Attempt("FAIL", "error")
+    try:
+        attempt = _request(
+            url, out_path, subject, timeout, metadata, conditional, limiter, etag, store, clock
+        )
+        return attempt
+    finally:
+        outcome = attempt.status if attempt.status != "FAIL" else f"FAIL:{attempt.error}"
+        connect = take_connect_time()
+        # Response.elapsed runs from sending the request, connecting included
+        ttfb = max(0.0, clock.ttfb - connect) if clock.ttfb else 0.0
+        timing = RequestTiming(
+            connect, ttfb, clock.transfer, clock.bytes, clock.http_status, outcome, clock.wait
+        )
+        bus.publish("request", url, out_path, subject=subject, size=clock.bytes, timing=timing)
+
+
+class _RequestClock:
+    """What _request measured, read by fetch_once even when it fails."""
+
+    def __init__(self):
+        self.wait = 0.0
+        self.ttfb = 0.0
+        self.transfer = 0.0
+        self.bytes = 0
+        self.http_status = None
+
+
+def _request(
+    url, out_path, subject, timeout, metadata, conditional, limiter, etag, store, clock
+) -> Attempt:
+    session = get_session()
+    tmp_path = store.tmp_path(url) if store is not None else out_path + ".part"
+    start = time.monotonic()
+    bus.publish("started", url, out_path, subject=subject)
+
+    def on_progress(size, total):
+        bus.publish("progress", url, out_path, subject=subject, size=size, total=total)
+
+    offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+    validator = _partial_validator(tmp_path) or etag
+    if offset and not validator:
+        # Without a validator a changed file can't be told apart; start over
+        _drop_partial(tmp_path)
+        offset = 0
+    headers = {}
+    if offset:
+        # Resume the partial body; If-Range restarts it if the file changed
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+    elif conditional and metadata is not None:
+        headers = metadata.conditional_headers(out_path)
+
+    if limiter is not None:
+        waited = time.perf_counter()
+        limiter.acquire()
+        clock.wait = time.perf_counter() - waited
+    status_code, latency, retry_after = None, 0.0, None
+    try:
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+            status_code, latency = r.status_code, r.elapsed.total_seconds()
+            clock.http_status, clock.ttfb = status_code, latency
+            if r.status_code in (200, 206):
+                etag = r.headers.get("ETag")
+                if r.status_code != 206 or _range_start(r) != offset:
+                    offset = 0
+                    validator = etag or r.headers.get("Last-Modified")
+                hasher = hashlib.sha256()
+                # Folders appear only for files that are actually served:
+                # _stream_pdf creates them once the body starts like a PDF
+                new_dirs = _missing_dirs(os.path.dirname(tmp_path))
+                started = time.perf_counter()
+                try:
+                    try:
+                        size = _stream_pdf(r, tmp_path, offset, on_progress, hasher)
+                    finally:
+                        clock.transfer = time.perf_counter() - started
+                        if os.path.exists(tmp_path):
+                            clock.bytes = os.path.getsize(tmp_path) - offset
+                            # For whichever run resumes it
+                            _keep_validator(tmp_path, validator)
+                except InvalidPDF as e:
+                    # Leaving the with-block drops the rest of the body unread
+                    _drop_partial(tmp_path)
+                    _remove_empty_dirs(new_dirs)
+                    logging.error(f"Invalid PDF ({e}): {url}")
+                    return Attempt("FAIL", "invalid")
+                digest = hasher.hexdigest()
+                if store is not None:
+                    store.commit(tmp_path, digest, out_path)
+                else:
+                    os.replace(tmp_path, out_path)
+                _drop_partial(tmp_path)
+                if metadata is not None:
+                    metadata.record(out_path, url, r.headers, size)
+                log_download_status(
+                    subject, url, out_path, "SUCCESS",
+                    size=size, duration=time.monotonic() - start, sha256=digest,
+                )
+                return Attempt("SUCCESS")
+            # Drain the (small) error body so the connection goes back to the pool
+            clock.bytes = len(r.content)
+            if r.status_code == 304:
+                log_download_status(subject, url, out_path, "NOT_MODIFIED")
+                return Attempt("NOT_MODIFIED")
             elif r.status_code == 404:
                 logging.error(f"File not found (404): {url}")
-                log_download_status(subject, url, out_path, "FAIL")
-                return False
-            else:
-                logging.error(f"Failed to download {url}: Status code {r.status_code}")
-                log_download_status(subject, url, out_path, "FAIL")
-        except requests.Timeout:
-            logging.error(f"Timeout error for {url}")
-        except requests.RequestException as e:
-            logging.error(f"Request error for {url}: {e}")
-        time.sleep(2 * attempt)
-    log_download_status(subject, url, out_path, "FAIL")
-    return False
+                log_download_status(subject, url, out_path, "MISSING")
+                return Attempt("MISSING")
+            elif r.status_code == 416:
+                # The partial body is stale or already too long; start over
+                _drop_partial(tmp_path)
+                logging.error(f"Range not satisfiable, restarting: {url}")
+                return Attempt("FAIL", "incomplete")
+            elif r.status_code in THROTTLE_STATUSES:
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                logging.error(f"Throttled ({r.status_code}) on {url}, Retry-After {retry_after}")
+                return Attempt("FAIL", "throttled", retry_after=retry_after)
+            logging.error(f"Failed to download {url}: Status code {r.status_code}")
+            return Attempt("FAIL", "server")
+    except requests.Timeout:
+        logging.error(f"Timeout error for {url}")
+        return Attempt("FAIL", "timeout", etag=etag)
+    except IncompleteDownload as e:
+        logging.error(f"Incomplete download of {url}: {e}")
+        return Attempt("FAIL", "incomplete", etag=etag)
+    except requests.RequestException as e:
+        logging.error(f"Request error for {url}: {e}")
+        return Attempt("FAIL", "connection", etag=etag)
+    finally:
+        if limiter is not None:
+            limiter.release(status_code, latency, retry_after)
+
+
+def _stream_pdf(
+    r: requests.Response, tmp_path: str, offset: int, on_progress=None, hasher=None
+) -> int:
+    """Stream a 200/206 body into tmp_path, appending from `offset`, and
+    return the complete file size.
+
+    The body is checked on the way through: Content-Type must not be text,
+    the first bytes must be %PDF, the size must match Content-Length and the
+    %%EOF trailer must close the file. Raises InvalidPDF as soon as the body
+    can't be a PDF and IncompleteDownload if it was cut short (the partial
+    file is kept so the next attempt can resume it). `on_progress(size,
+    total)` is called every PROGRESS_STEP bytes. `hasher` (a hashlib object)
+    is fed the whole file, including a resumed partial. The folder of
+    tmp_path is only created once the body starts like a PDF.
+    """
+    content_type = r.headers.get("Content-Type", "").lower()
+    if content_type.startswith("text/") or "html" in content_type or "json" in content_type:
+        raise InvalidPDF(f"Content-Type {content_type}")
+    length = r.headers.get("Content-Length", "")
+    expected = offset + int(length) if length.isdigit() else None
+
+    size = offset
+    reported = offset
+    # A partial file was already checked for the magic bytes when it was started
+    head = PDF_MAGIC if offset else b""
+    tail = b""
+    if offset:
+        with open(tmp_path, 'rb') as f:
+            if hasher is not None:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(block)
+            f.seek(max(0, offset - TRAILER_WINDOW))
+            tail = f.read()
+    f = None
+    try:
+        for chunk in r.iter_content(CHUNK_SIZE):
+            if not chunk:
+                continue
+            if len(head) < len(PDF_MAGIC):
+                head += chunk[:len(PDF_MAGIC) - len(head)]
+                if not PDF_MAGIC.startswith(head):
+                    raise InvalidPDF("no %PDF header")
+            if f is None:
+                os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+                f = open(tmp_path, 'ab' if offset else 'wb')
+            f.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            size += len(chunk)
+            tail = (tail + chunk)[-TRAILER_WINDOW:]
+            if on_progress is not None and size - reported >= PROGRESS_STEP:
+                reported = size
+                on_progress(size, expected)
+    except requests.exceptions.ChunkedEncodingError as e:
+        # urllib3 raises this when the connection closes before Content-Length
+        raise IncompleteDownload(f"got {size} of {expected} bytes") from e
+    finally:
+        if f is not None:
+            f.close()
+
+    if head != PDF_MAGIC:
+        raise InvalidPDF("empty body")
+    if expected is not None and size != expected:
+        raise IncompleteDownload(f"got {size} of {expected} bytes")
+    if PDF_TRAILER not in tail:
+        if expected is None:
+            raise IncompleteDownload("no %%EOF trailer")
+        raise InvalidPDF("no %%EOF trailer")
+    return size
+
+
+def _missing_dirs(path: str) -> List[str]:
+    """path and those of its parents that don't exist yet, deepest first."""
+    missing = []
+    while path and not os.path.isdir(path):
+        missing.append(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return missing
+
+
+def _remove_empty_dirs(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+
+
+def _partial_validator(tmp_path: str) -> str | None:
+    try:
+        with open(tmp_path + VALIDATOR_SUFFIX, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _keep_validator(tmp_path: str, validator: str | None) -> None:
+    path = tmp_path + VALIDATOR_SUFFIX
+    if validator is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w") as f:
+        f.write(validator)
+
+
+def _drop_partial(tmp_path: str) -> None:
+    """Delete a partial body and its validator."""
+    for path in (tmp_path, tmp_path + VALIDATOR_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _range_start(r: requests.Response) -> int | None:
+    # Content-Range: bytes 1000-4999/5000
+    match = re.match(r"bytes (\d+)-", r.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
@@ -0,0 +1,409 @@
+import gzip
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from pastpaper.utils import LOG_DIR
+
+INDEX_DIR = os.path.join(LOG_DIR, "index")
+MAGIC = b"PPX1"
+HEADER = struct.Struct("<4sII")  # magic, terms, documents
+TERM = struct.Struct("<IIII")  # name offset, name length, first posting, postings
+POSTING = struct.Struct("<IHH")  # document, page, occurrences on the page
+TRAILER = struct.Struct("<II")  # offsets of the postings and of the document list
+MAX_U16 = 0xFFFF
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were "
+    "which with".split()
+)
+# 9709_s23_qp_12.pdf <-> 9709_s23_ms_12.pdf
+PAIRS = {"qp": "ms", "ms": "qp"}
+PAIR_RE = re.compile(r"^(\d{4}_[msw]\d{2})_(qp|ms)((?:_\d+)?\.pdf)$")
+SNIPPET_WIDTH = 160
+
+
+class ExtractorMissing(Exception):
+    """Neither pypdf nor pdftotext is available to read PDFs."""
+
+
+def extractor() -> Optional[str]:
+    """The text extractor to use: "pypdf", "pdftotext" or None."""
+    try:
+        import pypdf  # noqa: F401
+
+        return "pypdf"
+    except ImportError:
+        pass
+    return "pdftotext" if shutil.which("pdftotext") else None
+
+
+def extract_pages(path: str) -> List[str]:
+    """The text of each page of a PDF. Runs in the indexing process pool."""
+    if extractor() == "pypdf":
+        from pypdf import PdfReader
+
+        return [page.extract_text() or "" for page in PdfReader(path).pages]
+    out = subprocess.run(
+        ["pdftotext", "-layout", "-enc", "UTF-8", path, "-"],
+        capture_output=True,
+        check=True,
+        timeout=120,
+    ).stdout.decode("utf-8", "replace")
+    # Pages end with a form feed, the last one included
+    pages = out.split("\f")
+    return pages[:-1] if pages and not pages[-1].strip() else pages
+
+
+def _extract(path: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    try:
+        return extract_pages(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+def paired_path(path: str) -> Optional[str]:
+    """The mark scheme of a question paper and vice versa, if downloaded.
+    Papers sit in .../<kind>/<file>, so the pair is in the sibling folder.
+    """
+    match = PAIR_RE.match(os.path.basename(path))
+    if not match:
+        return None
+    prefix, kind, suffix = match.groups()
+    other = PAIRS[kind]
+    folder = os.path.dirname(path)
+    if os.path.basename(folder) == kind:
+        folder = os.path.join(os.path.dirname(folder), other)
+    pair = os.path.join(folder, f"{prefix}_{other}{suffix}")
+    return pair if os.path.exists(pair) else None
+
+
+class Hit(NamedTuple):
+    path: str
+    score: float
+    pages: List[int]  # 1-based, those with the most query words first
+    pair: Optional[str]  # the paired mark scheme (or question paper)
+    snippet: str = ""
+
+
+class SearchIndex:
+    """Full-text index of the PDFs under a download root.
+
+    The inverted index is one binary file, read through mmap: a header, a
+    table of terms sorted by name (binary searched), the term names, the
+    postings, (document, page, occurrences) per term, and the document list
+    as JSON. Page text is cached gzipped per sha256 under text/, for
+    snippets and so that a file is only parsed once whatever its path.
+
+    build() is incremental: the inventory (inventory.Inventory) says which
+    files are there and what they hash to, postings of files seen before
+    are carried over from the old index, and only new or changed PDFs are
+    parsed, across a process pool. Everything lives in INDEX_DIR, one
+    folder per root.
+    """
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        key = hashlib.sha1(self.root.encode()).hexdigest()[:16]
+        self.path = path or os.path.join(INDEX_DIR, key)
+        self._file = None
+        self._map = None
+        self._docs = None
+        self._terms = 0
+        self._postings_offset = 0
+
+    # Reading
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, "index.bin")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def _open(self) -> None:
+        if self._map is not None:
+            return
+        self._file = open(self.index_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._terms, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"not a search index: {self.index_path}")
+        end = len(self._map) - TRAILER.size
+        self._postings_offset, docs_offset = TRAILER.unpack_from(self._map, end)
+        self._docs = json.loads(self._map[docs_offset:end])
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = self._file = self._docs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _term(self, i: int) -> Tuple[bytes, int, int]:
+        offset, length, first, count = TERM.unpack_from(self._map, HEADER.size + i * TERM.size)
+        return self._map[offset:offset + length], first, count
+
+    def _lower_bound(self, name: bytes) -> int:
+        lo, hi = 0, self._terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _postings(self, first: int, count: int) -> Iterator[Tuple[int, int, int]]:
+        start = self._postings_offset + first * POSTING.size
+        return POSTING.iter_unpack(self._map[start:start + count * POSTING.size])
+
+    def lookup(self, term: str) -> List[Tuple[int, int, int]]:
+        """Postings of a term; a trailing * matches every term with that prefix."""
+        self._open()
+        prefix = term.endswith("*")
+        name = term.rstrip("*").encode()
+        postings = []
+        i = self._lower_bound(name)
+        while i < self._terms:
+            found, first, count = self._term(i)
+            if found != name and not (prefix and found.startswith(name)):
+                break
+            postings.extend(self._postings(first, count))
+            i += 1
+        return postings
+
+    def search(
+        self,
+        query: str,
+        subject: Optional[str] = None,
+        kind: Optional[str] = None,
+        limit: int = 20,
+        snippets: bool = True,
+    ) -> List[Hit]:
+        """Papers containing every word of `query`, best first.
+
+        Words ending in * match as prefixes. Scores add up occurrences
+        weighted by how rare each word is. `subject` (a code such as 9709)
+        and `kind` (qp, ms, ...) narrow the papers searched.
+        """
+        self._open()
+        words = [w.lower() for w in query.split()]
+        terms = [t + "*" if w.endswith("*") else t for w in words for t in tokenize(w)]
+        if not terms:
+            return []
+        from pastpaper.metrics import paper_kind
+
+        lists = [self.lookup(term) for term in dict.fromkeys(terms)]
+        doc_sets = [{doc for doc, _, _ in postings} for postings in lists]
+        if not all(doc_sets):
+            # A word no paper contains
+            return []
+        matched = set.intersection(*doc_sets)
+        if subject:
+            matched = {d for d in matched if os.path.basename(self._docs[d][0]).startswith(f"{subject}_")}
+        if kind:
+            matched = {d for d in matched if paper_kind(self._docs[d][0]) == kind}
+
+        total = len(self._docs)
+        scores: Dict[int, float] = {}
+        pages: Dict[int, Dict[int, int]] = {}  # doc -> page -> words found on it
+        for postings, docs in zip(lists, doc_sets):
+            idf = math.log(1 + total / len(docs))
+            for doc, page, count in postings:
+                if doc in matched:
+                    scores[doc] = scores.get(doc, 0.0) + count * idf
+                    found = pages.setdefault(doc, {})
+                    found[page] = found.get(page, 0) + 1
+
+        hits = []
+        for doc in sorted(matched, key=lambda d: -scores[d])[:limit]:
+            found = pages[doc]
+            doc_pages = sorted(found, key=lambda page: (-found[page], page))
+            path = os.path.join(self.root, self._docs[doc][0])
+            snippet = self.snippet(self._docs[doc][1], doc_pages[0], terms) if snippets else ""
+            hits.append(
+                Hit(path, round(scores[doc], 3), [p + 1 for p in doc_pages], paired_path(path), snippet)
+            )
+        return hits
+
+    def snippet(self, digest: str, page: int, terms: List[str]) -> str:
+        """A line of text around the first query word on a page."""
+        pages = self._load_text(digest)
+        if not pages or page >= len(pages):
+            return ""
+        text = " ".join(pages[page].split())
+        pattern = "|".join(
+            rf"\b{re.escape(t.rstrip('*'))}" + ("" if t.endswith("*") else r"\b") for t in terms
+        )
+        match = re.search(pattern, text, re.IGNORECASE)
+        start = max(0, (match.start() if match else 0) - SNIPPET_WIDTH // 3)
+        return text[start:start + SNIPPET_WIDTH]
+
+    # Building
+
+    def _text_path(self, digest: str) -> str:
+        return os.path.join(self.path, "text", digest[:2], f"{digest}.json.gz")
+
+    def _load_text(self, digest: str) -> Optional[List[str]]:
+        try:
+            with gzip.open(self._text_path(digest), "rt", encoding="utf-8") as f:
+                return json.load(f)["pages"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_text(self, digest: str, pages: List[str], error: Optional[str] = None) -> None:
+        path = self._text_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"pages": pages, "error": error}, f)
+        os.replace(tmp_path, path)
+
+    def _old_postings(self) -> Tuple[Dict[str, List[Tuple[int, int, int]]], Dict[str, int]]:
+        """The current index as term -> postings, and sha256 -> document."""
+        if not self.exists():
+            return {}, {}
+        self._open()
+        by_digest = {}
+        for doc, (_, digest) in enumerate(self._docs):
+            by_digest.setdefault(digest, doc)
+        postings = {}
+        for i in range(self._terms):
+            name, first, count = self._term(i)
+            postings[name.decode()] = list(self._postings(first, count))
+        self.close()
+        return postings, by_digest
+
+    def build(self, workers: Optional[int] = None, full: bool = False, progress: bool = True) -> dict:
+        """Bring the index up to date with the PDFs under the root.
+
+        With `full`, every file is parsed again. Raises ExtractorMissing if
+        there is something to parse and nothing to parse it with.
+        """
+        from tqdm import tqdm
+
+        from pastpaper.inventory import Inventory
+        from pastpaper.store import BlobStore
+        from pastpaper.utils import enable_error_log
+
+        enable_error_log()
+        started = time.time()
+        inventory = Inventory(self.root, BlobStore(self.root)).scan()
+        inventory.save()
+        docs = sorted((rel, info.sha256) for rel, info in inventory.files().items() if info.ok)
+
+        old, old_docs = ({}, {}) if full else self._old_postings()
+        texts = {}  # sha256 -> pages, for files not in the old index
+        for rel, digest in docs:
+            if digest not in old_docs and digest not in texts:
+                texts[digest] = None if full else self._load_text(digest)
+        parse = {
+            digest: os.path.join(self.root, rel)
+            for rel, digest in docs
+            if digest in texts and texts[digest] is None
+        }
+        failed = 0
+        if parse:
+            if extractor() is None:
+                raise ExtractorMissing("install pypdf (pip install pypdf) or poppler's pdftotext")
+            with ProcessPoolExecutor(max_workers=workers) as pool, tqdm(
+                total=len(parse), unit="file", desc="indexing", disable=None if progress else True
+            ) as bar:
+                futures = {pool.submit(_extract, path): digest for digest, path in parse.items()}
+                for future in as_completed(futures):
+                    digest = futures[future]
+                    pages, error = future.result()
+                    if error:
+                        failed += 1
+                        logging.error(f"Could not read {parse[digest]}: {error}")
+                    # Failures are cached too, so they aren't retried every run
+                    self._save_text(digest, pages or [], error)
+                    texts[digest] = pages or []
+                    bar.update(1)
+
+        postings: Dict[str, List[Tuple[int, int, int]]] = {}
+        reused = {}  # old document -> new documents
+        for doc, (rel, digest) in enumerate(docs):
+            if digest in old_docs:
+                reused.setdefault(old_docs[digest], []).append(doc)
+                continue
+            for page, text in enumerate(texts[digest][:MAX_U16]):
+                for term, count in Counter(tokenize(text)).items():
+                    postings.setdefault(term, []).append((doc, page, min(count, MAX_U16)))
+        for term, entries in old.items():
+            for old_doc, page, count in entries:
+                for doc in reused.get(old_doc, ()):
+                    postings.setdefault(term, []).append((doc, page, count))
+
+        self._write(docs, postings)
+        self._prune_text({digest for _, digest in docs})
+        return {
+            "documents": len(docs),
+            "parsed": len(parse),
+            "failed": failed,
+            "reused": sum(len(new) for new in reused.values()),
+            "terms": len(postings),
+            "seconds": round(time.time() - started, 3),
+        }
+
+    def _write(self, docs: List[Tuple[str, str]], postings: Dict[str, List[Tuple[int, int, int]]]) -> None:
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+        names = sorted(term.encode() for term in postings)
+        table = bytearray()
+        blob = bytearray()
+        first = 0
+        names_offset = HEADER.size + len(names) * TERM.size
+        for name in names:
+            count = len(postings[name.decode()])
+            table += TERM.pack(names_offset + len(blob), len(name), first, count)
+            blob += name
+            first += count
+        postings_offset = names_offset + len(blob)
+
+        # Readers map the file, so it is replaced whole, never rewritten
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(names), len(docs)))
+            f.write(table)
+            f.write(blob)
+            for name in names:
+                entries = sorted(postings[name.decode()])
+                f.write(b"".join(POSTING.pack(*entry) for entry in entries))
+            docs_offset = f.tell()
+            f.write(json.dumps(docs).encode())
+            f.write(TRAILER.pack(postings_offset, docs_offset))
+        os.replace(tmp_path, self.index_path)
+
+    def _prune_text(self, keep: set) -> None:
+        """Drop cached text of files no longer in the library."""
+        for dirpath, _, filenames in os.walk(os.path.join(self.path, "text")):
+            for name in filenames:
+                if name.split(".", 1)[0] not in keep:
+                    os.remove(os.path.join(dirpath, name))
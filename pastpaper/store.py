@@ -0,0 +1,151 @@
+import errno
+import hashlib
+import os
+import shutil
+import socket
+import time
+
+from pastpaper.lease import LEASE_TTL
+
+STORE_DIR = ".store"
+
+
+def _clone(src: str, dst: str) -> None:
+    """Hard link dst to src, falling back to a reflink and then a copy
+    where hard links aren't possible (other filesystem, no link support).
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+    try:
+        import fcntl
+
+        FICLONE = 0x40049409  # Linux; btrfs, XFS and friends
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+
+class StoreError(Exception):
+    """The store can't do what was asked, e.g. prune without hard links."""
+
+
+class BlobStore:
+    """Content-addressed store of downloaded PDFs under <root>/.store.
+
+    Every file is kept once, as .store/sha256/<ab>/<digest>.pdf, and each
+    output path is a hard link to its blob, so overlapping selections cost
+    no extra disk. Blobs are never modified in place; a changed paper gets a
+    new blob and its output paths are re-linked. Partial downloads live in
+    .store/tmp until they are committed, and the leases of runs sharing the
+    root in .store/leases.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.join(os.path.abspath(os.path.expanduser(root)), STORE_DIR)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "sha256", digest[:2], f"{digest}.pdf")
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.blob_path(digest))
+
+    def discard(self, digest: str) -> None:
+        """Forget a blob, e.g. one found damaged on disk."""
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def tmp_path(self, url: str) -> str:
+        """Where the partial body of url is kept, stable across runs so that
+        interrupted downloads can be resumed. The folder is left to the writer.
+        """
+        return os.path.join(self.root, "tmp", hashlib.sha1(url.encode()).hexdigest() + ".part")
+
+    def lease_dir(self) -> str:
+        """Where runs sharing this root keep their per-file leases (see lease.Leases)."""
+        return os.path.join(self.root, "leases")
+
+    def link(self, digest: str, out_path: str) -> None:
+        """Point out_path at the blob, atomically replacing whatever is there."""
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        # Named per process, as other runs may be linking the same path
+        tmp_link = f"{out_path}.{socket.gethostname()}-{os.getpid()}.link"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        _clone(self.blob_path(digest), tmp_link)
+        os.replace(tmp_link, out_path)
+
+    def commit(self, tmp_path: str, digest: str, out_path: str) -> None:
+        """Move a finished download into the store and link out_path to it."""
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            try:
+                self.link(digest, out_path)
+            except FileNotFoundError:
+                pass  # pruned meanwhile; the download takes its place
+            else:
+                os.remove(tmp_path)
+                return
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(tmp_path, blob)
+        self.link(digest, out_path)
+
+    def hard_links_work(self) -> bool:
+        """Whether output paths under the root can be hard links to blobs,
+        rather than the reflinks or copies _clone falls back to.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        name = f"link-probe-{socket.gethostname()}-{os.getpid()}"
+        probe = os.path.join(self.root, name)
+        target = os.path.join(os.path.dirname(self.root), f".{name}")
+        with open(probe, "w"):
+            pass
+        try:
+            os.link(probe, target)
+            os.remove(target)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.remove(probe)
+
+    def stats(self) -> dict:
+        blobs = size = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "sha256")):
+            for name in filenames:
+                blobs += 1
+                size += os.path.getsize(os.path.join(dirpath, name))
+        return {"blobs": blobs, "bytes": size}
+
+    def prune(self) -> int:
+        """Delete blobs no output path links to any more. Returns how many.
+
+        A link count of 1 only means the store holds the only reference
+        where output paths are hard links, so a store that can't hard link
+        raises StoreError instead. Blobs changed within LEASE_TTL are left
+        alone (a rename or new link counts as a change): a run sharing the
+        root may have just committed one and not linked it yet.
+        """
+        if not self.hard_links_work():
+            raise StoreError(f"{os.path.dirname(self.root)} can't hard link into the store")
+        cutoff = time.time() - LEASE_TTL
+        removed = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "sha256")):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if st.st_nlink == 1 and st.st_ctime < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
@@ -1,4 +1,6 @@
 # UI String : Code : API Folder String
+# The menu's subjects. catalog.Catalog discovers every subject and its
+# folder from the site; these slugs are only used when it can't be reached.
 SUBJECTS = {
     "1": ("chemistry", "9701", "Chemistry-9701"),
     "2": ("physics", "9702", "Physics-9702"),
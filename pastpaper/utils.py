@@ -1,6 +1,60 @@
+import logging
 import os
 import re
 
+# Status log, caches and other state shared between runs
+LOG_DIR = os.environ.get("PASTPAPER_LOG_DIR") or os.path.expanduser("~/pastpaper_logs")
+ERROR_LOG = os.path.join(LOG_DIR, "pastpaper.log")
+
+
+class _LazyFileHandler(logging.FileHandler):
+    """FileHandler that creates its folder and file only once there is
+    something to write.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+_error_log = None
+
+
+def enable_error_log() -> None:
+    """Send logged errors to ERROR_LOG (once per process), unless the
+    application has set up logging itself.
+    """
+    global _error_log
+    root = logging.getLogger()
+    if _error_log is not None or root.handlers:
+        return
+    _error_log = _LazyFileHandler(ERROR_LOG)
+    _error_log.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    root.addHandler(_error_log)
+    root.setLevel(logging.ERROR)
+
+
+def append_locked(path: str, text: str) -> None:
+    """Append text to a log shared with other processes, holding an
+    exclusive flock so that their lines never interleave.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows: appends of one short line don't mix anyway
+            f.write(text)
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(text)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
@@ -0,0 +1,184 @@
+import curses
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENTER_KEYS = (10, 13, curses.KEY_ENTER)
+BACKSPACE_KEYS = (curses.KEY_BACKSPACE, 127, 8)
+ESC = 27
+# Left margin of the list, inside the border
+MARGIN = 4
+
+
+def option_label(value) -> str:
+    """Menu text of an option: the first field of a tuple, else the value."""
+    return value[0] if isinstance(value, tuple) else str(value)
+
+
+def _fit(text: str, width: int) -> str:
+    if len(text) > width:
+        text = text[: max(0, width - 3)] + "..."
+    return text.ljust(width)
+
+
+class ListWidget:
+    """A scrolling, filterable menu over `options` (key -> value), returning
+    the chosen key, or with `multi` the list of selected keys.
+
+    Only the rows that fit between the title and the hint line are drawn,
+    and a row is only written again when its text or highlight changed, so
+    moving through hundreds of options costs the same as through three.
+    Typing filters the options by substring (case-insensitive); every
+    narrowing filters the previous matches and backspace pops back to them,
+    so filtering never rescans the whole list. In `multi` mode SPACE toggles
+    the highlighted option, so filters can't contain spaces.
+
+    `background` redraws whatever sits behind the list (border, logo) after
+    a clear and returns the row the title goes on; it runs on the first
+    frame and after a resize. ESC clears the filter, or quits if it is empty.
+    """
+
+    def __init__(
+        self,
+        stdscr,
+        title: str,
+        options: Dict,
+        multi: bool = False,
+        background: Optional[Callable[[], int]] = None,
+        label: Callable = option_label,
+    ):
+        self.stdscr = stdscr
+        self.title = title
+        self.keys = list(options)
+        self.labels = [label(options[key]) for key in self.keys]
+        self._folded = [text.lower() for text in self.labels]
+        self.multi = multi
+        self.background = background
+        self.selected = set()
+        self.query = ""
+        self.cursor = 0  # position in matches
+        self.offset = 0  # first match shown
+        self._matches: List[List[int]] = [list(range(len(self.keys)))]
+        self._drawn: Dict[int, Tuple[str, int]] = {}
+        self.top = self.rows = self.width = 0
+
+    @property
+    def matches(self) -> List[int]:
+        return self._matches[-1]
+
+    # Filtering
+
+    def _narrow(self, char: str) -> None:
+        self.query += char
+        query = self.query.lower()
+        self._matches.append([i for i in self.matches if query in self._folded[i]])
+        self.cursor = self.offset = 0
+
+    def _widen(self) -> None:
+        if self.query:
+            self.query = self.query[:-1]
+            self._matches.pop()
+            self.cursor = self.offset = 0
+
+    def _clear_filter(self) -> None:
+        self.query = ""
+        del self._matches[1:]
+        self.cursor = self.offset = 0
+
+    # Drawing
+
+    def _repaint(self) -> None:
+        """Full redraw: after the first key and after a resize."""
+        self.stdscr.clear()
+        self.top = self.background() if self.background else 0
+        height, width = self.stdscr.getmaxyx()
+        self.width = max(1, width - MARGIN - 2)
+        # Title, filter line, rows, then the hint above the bottom border
+        self.rows = max(1, height - self.top - 5)
+        self._drawn = {}
+        self._put(self.top, self.title, curses.color_pair(1) | curses.A_BOLD, center=True)
+
+    def _put(self, y: int, text: str, attr: int = 0, center: bool = False) -> None:
+        if center:
+            text = text.center(self.width)
+        text = _fit(text, self.width)
+        if self._drawn.get(y) == (text, attr):
+            return
+        self._drawn[y] = (text, attr)
+        try:
+            self.stdscr.addstr(y, MARGIN, text, attr)
+        except curses.error:
+            pass
+
+    def _scroll(self) -> None:
+        if self.cursor < self.offset:
+            self.offset = self.cursor
+        elif self.cursor >= self.offset + self.rows:
+            self.offset = self.cursor - self.rows + 1
+
+    def _draw(self) -> None:
+        matches = self.matches
+        self._scroll()
+        more = ("↑" if self.offset else " ") + ("↓" if self.offset + self.rows < len(matches) else " ")
+        status = f"{len(matches)}/{len(self.keys)} {more}"
+        line = f"Filter: {self.query}_" if self.query else "Type to filter"
+        self._put(self.top + 1, line.ljust(max(0, self.width - len(status))) + status, curses.color_pair(4))
+        for row in range(self.rows):
+            position = self.offset + row
+            text, attr = "", 0
+            if position < len(matches):
+                i = matches[position]
+                text = self.labels[i]
+                if self.multi:
+                    text = f"{'✔' if self.keys[i] in self.selected else '○'} {text}"
+                if position == self.cursor:
+                    attr = curses.color_pair(2) | curses.A_REVERSE
+            self._put(self.top + 2 + row, text, attr)
+        if self.multi:
+            hint = "SPACE = select | ENTER = confirm | type to filter | ESC = quit"
+        else:
+            hint = "ENTER = choose | type to filter | ESC = clear filter / quit"
+        self._put(self.top + 2 + self.rows, hint, curses.color_pair(3), center=True)
+        self.stdscr.noutrefresh()
+        curses.doupdate()
+
+    # Input
+
+    def run(self):
+        curses.curs_set(0)
+        if hasattr(curses, "set_escdelay"):
+            # ESC is a key here, not the start of a sequence to wait for
+            curses.set_escdelay(25)
+        self._repaint()
+        while True:
+            self._draw()
+            key = self.stdscr.getch()
+            matches = self.matches
+            if key == curses.KEY_RESIZE:
+                self._repaint()
+            elif key == curses.KEY_UP:
+                self.cursor = max(0, self.cursor - 1)
+            elif key == curses.KEY_DOWN:
+                self.cursor = max(0, min(len(matches) - 1, self.cursor + 1))
+            elif key == curses.KEY_PPAGE:
+                self.cursor = max(0, self.cursor - self.rows)
+            elif key == curses.KEY_NPAGE:
+                self.cursor = max(0, min(len(matches) - 1, self.cursor + self.rows))
+            elif key == curses.KEY_HOME:
+                self.cursor = 0
+            elif key == curses.KEY_END:
+                self.cursor = max(0, len(matches) - 1)
+            elif key in ENTER_KEYS:
+                if self.multi:
+                    return [k for k in self.keys if k in self.selected]
+                if matches:
+                    return self.keys[matches[self.cursor]]
+            elif key == ord(" ") and self.multi:
+                if matches:
+                    self.selected.symmetric_difference_update({self.keys[matches[self.cursor]]})
+            elif key in BACKSPACE_KEYS:
+                self._widen()
+            elif key == ESC:
+                if not self.query:
+                    exit(0)
+                self._clear_filter()
+            elif 32 <= key < 127:
+                self._narrow(chr(key))
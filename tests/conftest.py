@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+# State (ledger, caches, logs) must never land in the real ~/pastpaper_logs;
+# LOG_DIR is read when pastpaper.utils is first imported
+os.environ["PASTPAPER_LOG_DIR"] = tempfile.mkdtemp(prefix="pastpaper-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from pastpaper import scraper
+from pastpaper.fakeserver import FakeServer, FaultConfig
+
+
+@pytest.fixture
+def server():
+    """start(**faults) runs a FakeServer with those FaultConfig faults and
+    points the scraper at it; every server started is stopped afterwards.
+    """
+    servers = []
+
+    def start(**faults):
+        fake = FakeServer(FaultConfig(**faults)).start()
+        servers.append(fake)
+        scraper.configure(server=fake.url)
+        return fake
+
+    yield start
+    for fake in servers:
+        fake.stop()
+    scraper.configure(server=scraper.DEFAULT_SERVER)
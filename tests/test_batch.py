@@ -0,0 +1,30 @@
+import pytest
+
+from pastpaper.batch import JobError, Shard, expand_subjects, parse_shard
+from pastpaper.fakeserver import SUBJECT_FOLDERS
+
+
+def test_all_subjects_come_from_the_catalog(server):
+    server()
+    codes = {code for _, code, _ in expand_subjects("all")}
+    assert len(codes) == len(SUBJECT_FOLDERS)
+    assert {"9702", "9618", "9990"} <= codes
+
+
+def test_subject_by_name_keeps_builtin_folder_name(server):
+    server()
+    assert expand_subjects("9618") == [
+        ("computer science", "9618", "Computer Science (for first examination in 2021) (9618)")
+    ]
+    with pytest.raises(JobError):
+        expand_subjects("basket weaving")
+
+
+def test_shards_split_folders_between_them():
+    assert parse_shard("2/4") == Shard(2, 4)
+    for bad in ("0/2", "3/2", "two"):
+        with pytest.raises(JobError):
+            parse_shard(bad)
+    folders = [f"A-Level/Physics (9702)/20{y}-May-June" for y in range(10, 30)]
+    owners = [[shard for shard in range(1, 4) if Shard(shard, 3).owns(f)] for f in folders]
+    assert all(len(owner) == 1 for owner in owners)
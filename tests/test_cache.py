@@ -0,0 +1,44 @@
+import multiprocessing
+
+from pastpaper.cache import MetadataStore, NegativeCache
+
+
+def _record(path, barrier, worker):
+    store = MetadataStore(path)
+    barrier.wait()  # both have read the file before either saves
+    for i in range(200):
+        store.record(f"/lib/{worker}/{i}.pdf", f"https://example/{worker}/{i}", {"ETag": f'"{i}"'}, i)
+    barrier.wait()
+    store.save()
+
+
+def test_concurrent_saves_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "metadata.json")
+    barrier = multiprocessing.Barrier(2)
+    workers = [
+        multiprocessing.Process(target=_record, args=(path, barrier, worker)) for worker in "ab"
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+    assert len(MetadataStore(path)) == 400
+
+
+def test_save_merges_removals_and_additions(tmp_path):
+    path = str(tmp_path / "negative_cache.json")
+    seed = NegativeCache(path)
+    seed.add("https://example/old")
+    seed.save()
+
+    first, second = NegativeCache(path), NegativeCache(path)
+    first.discard("https://example/old")
+    second.add("https://example/new")
+    first.save()
+    second.save()
+
+    merged = NegativeCache(path)
+    assert not merged.is_missing("https://example/old")
+    assert merged.is_missing("https://example/new")
+    assert second.is_missing("https://example/new") and len(second) == 1
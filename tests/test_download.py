@@ -0,0 +1,184 @@
+import hashlib
+import os
+
+from pastpaper import scraper
+from pastpaper.cache import MetadataStore
+from pastpaper.engine import RETRY_POLICIES, run_tasks
+from pastpaper.fakeserver import FaultConfig, synthetic_pdf
+from pastpaper.ledger import get_ledger
+from pastpaper.ratelimit import AdaptiveLimiter
+from pastpaper.store import BlobStore
+
+SIZE = FaultConfig().size
+NAME = "9702_s23_qp_12.pdf"
+
+
+def paper_url(name: str = NAME) -> str:
+    return f"{scraper.BASE_API}/{scraper.BOARD}/A-Level/Physics%20(9702)/2023-May-June/{name}?download=true"
+
+
+def body(name: str = NAME) -> bytes:
+    return synthetic_pdf(name, SIZE)
+
+
+def test_resume_sends_if_range_with_the_kept_validator(server, tmp_path):
+    fake = server()
+    out = tmp_path / NAME
+    part = tmp_path / (NAME + ".part")
+    part.write_bytes(body()[:1000])
+    with scraper.http_session(1):
+        etag = scraper.get_session().head(paper_url()).headers["ETag"]
+    (tmp_path / (NAME + ".part" + scraper.VALIDATOR_SUFFIX)).write_text(etag)
+
+    assert scraper.fetch_once(paper_url(), str(out)).status == "SUCCESS"
+    assert out.read_bytes() == body()
+    assert fake.stats.get(206) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [NAME]
+
+
+def test_partial_of_a_changed_file_is_not_spliced(server, tmp_path):
+    server()
+    out = tmp_path / NAME
+    part = tmp_path / (NAME + ".part")
+    part.write_bytes(synthetic_pdf("an older version", SIZE)[:1000])
+    (tmp_path / (NAME + ".part" + scraper.VALIDATOR_SUFFIX)).write_text('"older"')
+
+    assert scraper.fetch_once(paper_url(), str(out)).status == "SUCCESS"
+    assert out.read_bytes() == body()
+
+
+def test_partial_without_validator_starts_over(server, tmp_path):
+    fake = server()
+    out = tmp_path / NAME
+    (tmp_path / (NAME + ".part")).write_bytes(synthetic_pdf("an older version", SIZE)[:1000])
+
+    assert scraper.fetch_once(paper_url(), str(out)).status == "SUCCESS"
+    assert out.read_bytes() == body()
+    assert 206 not in fake.stats
+
+
+def test_bodies_are_requested_unencoded():
+    with scraper.http_session(1) as session:
+        assert session.headers["Accept-Encoding"] == "identity"
+
+
+def test_html_body_is_rejected_without_leaving_folders(server, tmp_path):
+    server(html=1.0)
+    out = tmp_path / "Physics-9702" / "2023-May-June" / "qp" / NAME
+
+    attempt = scraper.fetch_once(paper_url(), str(out))
+    assert attempt == scraper.Attempt("FAIL", "invalid")
+    assert list(tmp_path.iterdir()) == []
+    assert scraper.download_file(paper_url(), str(out), retries=1) == "FAIL"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_truncated_body_resumes_with_206(server, tmp_path):
+    fake = server(truncate=1.0)
+    out = tmp_path / NAME
+
+    attempt = scraper.fetch_once(paper_url(), str(out))
+    assert (attempt.status, attempt.error) == ("FAIL", "incomplete")
+    assert not out.exists()
+    # Whole chunks only: urllib3 drops the short read the connection ended on
+    assert 0 < (tmp_path / (NAME + ".part")).stat().st_size <= SIZE // 2
+
+    fake.faults = fake.faults._replace(truncate=0.0)
+    assert scraper.fetch_once(paper_url(), str(out), etag=attempt.etag).status == "SUCCESS"
+    assert out.read_bytes() == body()
+    assert fake.stats.get(206) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [NAME]
+
+
+def test_throttling_honours_retry_after(server, tmp_path):
+    server(throttle=1.0, retry_after=60)
+    limiter = AdaptiveLimiter()
+
+    attempt = scraper.fetch_once(paper_url(), str(tmp_path / NAME), limiter=limiter)
+    assert attempt == scraper.Attempt("FAIL", "throttled", retry_after=60.0)
+    assert limiter.paused_for > 55
+    assert RETRY_POLICIES["throttled"].delay(1, attempt.retry_after) >= 60
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unchanged_file_revalidates_with_304(server, tmp_path):
+    fake = server()
+    out = tmp_path / NAME
+    metadata = MetadataStore(str(tmp_path / "metadata.json"))
+    assert scraper.fetch_once(paper_url(), str(out), metadata=metadata).status == "SUCCESS"
+    mtime = out.stat().st_mtime_ns
+
+    attempt = scraper.fetch_once(paper_url(), str(out), metadata=metadata, conditional=True)
+    assert attempt.status == "NOT_MODIFIED"
+    assert fake.stats.get(304) == 1
+    assert out.stat().st_mtime_ns == mtime
+
+
+def test_store_and_ledger_round_trip(server, tmp_path):
+    fake = server()
+    store = BlobStore(str(tmp_path / "lib"))
+    names = [NAME, "9702_s23_ms_12.pdf"]
+    tasks = [(paper_url(name), str(tmp_path / "lib" / name)) for name in names]
+
+    results = run_tasks(tasks, workers=2, store=store)
+    assert sorted(result.status for result in results) == ["SUCCESS", "SUCCESS"]
+    for (url, out_path), name in zip(tasks, names):
+        digest = hashlib.sha256(body(name)).hexdigest()
+        assert get_ledger().latest_digest(url) == digest
+        assert store.has(digest)
+        with open(out_path, "rb") as f:
+            assert f.read() == body(name)
+
+    # A deleted file comes back from the store, without a request
+    os.remove(tasks[0][1])
+    requests_made = sum(fake.stats.values())
+    results = run_tasks(tasks, workers=2, store=store)
+    assert sorted(result.status for result in results) == ["LINKED", "SKIPPED"]
+    assert sum(fake.stats.values()) == requests_made
+    with open(tasks[0][1], "rb") as f:
+        assert f.read() == body()
+
+
+def test_missing_file_is_logged_as_missing(server, tmp_path):
+    server(missing=1.0)
+    out = tmp_path / NAME
+
+    assert scraper.fetch_once(paper_url(), str(out)).status == "MISSING"
+    assert get_ledger().latest(paper_url())["status"] == "MISSING"
+
+
+def test_empty_listing_gives_no_tasks(server, tmp_path):
+    server(missing=1.0)
+    listing = scraper.fetch_session_listing("A-Level", "Physics (9702)", "2023-March")
+    assert listing == set()
+    tasks = scraper.build_download_tasks(
+        "9702", "Physics (9702)", "A-Level", "all", ["m"], ["March"], ["23"], None, str(tmp_path)
+    )
+    assert tasks == []
+
+
+def test_scrape_subject_uses_session_folder_names(server, tmp_path):
+    fake = server(size=2048)
+    out_dir = tmp_path / "Physics-9702"
+    scraper.scrape_subject("9702", "A-Level", "both (qp & ms)", ["s"], ["23"], str(out_dir), workers=2)
+
+    assert sorted(p.name for p in out_dir.iterdir()) == ["2023-May-June"]
+    assert len(list(out_dir.glob("2023-May-June/*/*.pdf"))) == 24
+    assert 404 not in fake.stats
+
+
+def test_fake_server_rejects_session_code_folders(server):
+    server()
+    with scraper.http_session(1) as session:
+        assert session.get(paper_url()).status_code == 200
+        assert session.get(paper_url().replace("2023-May-June", "2023-s")).status_code == 404
+        assert session.get(paper_url().replace("2023-May-June", "2022-May-June")).status_code == 404
+
+
+def test_session_pool_grows_to_the_worker_count():
+    scraper.close_session()
+    scraper.get_session()  # e.g. a catalog lookup before the run
+    with scraper.http_session(16) as session:
+        assert session.get_adapter("https://pastpapers.co")._pool_maxsize == 16
+        assert scraper.open_session(4) is session
+        assert session.get_adapter("http://127.0.0.1")._pool_maxsize == 16
@@ -0,0 +1,33 @@
+import threading
+
+from pastpaper.engine import DownloadEngine
+from pastpaper.fakeserver import synthetic_pdf
+from pastpaper.inventory import Inventory
+
+
+def test_all_workers_may_talk_to_one_host():
+    # Every paper comes from the same host
+    assert DownloadEngine(workers=16).per_host == 16
+    assert DownloadEngine(workers=16, per_host=4).per_host == 4
+    assert DownloadEngine(workers=2, per_host=4).per_host == 2
+
+
+def test_inventory_is_scanned_on_the_producer_thread(tmp_path):
+    paper = tmp_path / "2023-May-June" / "qp" / "9702_s23_qp_12.pdf"
+    paper.parent.mkdir(parents=True)
+    paper.write_bytes(synthetic_pdf(paper.name, 2048))
+    inventory = Inventory(str(tmp_path), path=str(tmp_path / ".inventory.json"))
+    scanned_on = []
+    scan = inventory.scan
+
+    def record():
+        scanned_on.append(threading.current_thread())
+        return scan()
+
+    inventory.scan = record
+    engine = DownloadEngine(workers=1, inventory=inventory)
+    assert scanned_on == []
+
+    results = engine.run([("http://127.0.0.1:9/never-requested.pdf", str(paper))])
+    assert [result.status for result in results] == ["SKIPPED"]
+    assert scanned_on and scanned_on[0] is not threading.main_thread()
@@ -0,0 +1,43 @@
+import time
+
+from pastpaper.ledger import Ledger
+
+URL = "https://example.test/9702_s23_qp_12.pdf?download=true"
+PATH = "/lib/Physics-9702/2023-May-June/qp/9702_s23_qp_12.pdf"
+
+
+def test_record_and_latest(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite3"))
+    ledger.record("9702", URL, PATH, "FAIL")
+    ledger.record("9702", URL, PATH, "SUCCESS", size=1234, duration=0.5, sha256="ab" * 32)
+    assert ledger.latest(URL)["status"] == "SUCCESS"
+    assert ledger.latest_digest(URL) == "ab" * 32
+    assert ledger.known_sizes() == {URL: 1234}
+    assert ledger.summary() == {"SUCCESS": 1}
+    assert ledger.failures() == []
+
+
+def test_compact_keeps_digest_and_size_behind_skips(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite3"))
+    ledger.record("9702", URL, PATH, "FAIL")
+    ledger.record("9702", URL, PATH, "SUCCESS", size=1234, sha256="ab" * 32)
+    ledger.record("9702", URL, PATH, "SKIPPED")
+    ledger.record("9702", URL, PATH, "SKIPPED")
+
+    assert ledger.compact() == 2
+    assert ledger.latest(URL)["status"] == "SKIPPED"
+    assert ledger.latest_digest(URL) == "ab" * 32
+    assert ledger.known_sizes() == {URL: 1234}
+    assert ledger.summary() == {"SKIPPED": 1}
+
+
+def test_compact_keep_days_spares_digest_rows(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite3"))
+    ledger.record("9702", URL, PATH, "SUCCESS", size=1234, sha256="ab" * 32)
+    ledger.record("9702", URL, PATH, "SKIPPED")
+    with ledger._db:
+        ledger._db.execute("UPDATE events SET ts = ?", (time.time() - 90 * 24 * 60 * 60,))
+
+    ledger.compact(keep_days=30)
+    assert ledger.latest_digest(URL) == "ab" * 32
+    assert ledger.known_sizes() == {URL: 1234}
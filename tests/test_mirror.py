@@ -0,0 +1,25 @@
+from pastpaper.cache import session_is_recent
+from pastpaper.mirror import run_mirror
+
+
+def test_second_mirror_lists_only_unfinished_folders(server, tmp_path):
+    # Most folders list no papers at all, like sessions a syllabus doesn't sit
+    fake = server(missing=0.97, size=2048)
+    listed = []
+    listing = fake.listing
+
+    def record(directory):
+        listed.append(directory)
+        return listing(directory)
+
+    fake.listing = record
+    first = run_mirror(str(tmp_path), since=2022, progress=False)
+    assert first["folders"]["complete"] > 0
+    folders = [d for d in listed if d.count("/") == 2]
+    assert len(folders) == first["folders"]["checked"]
+
+    listed.clear()
+    second = run_mirror(str(tmp_path), since=2022, progress=False)
+    folders = [d for d in listed if d.count("/") == 2]
+    assert len(folders) == second["folders"]["checked"] == first["folders"]["incomplete"]
+    assert all(session_is_recent(f"/{folder}/") for folder in folders)
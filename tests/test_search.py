@@ -0,0 +1,41 @@
+import pytest
+
+from pastpaper.search import SearchIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "lib"), path=str(tmp_path / "index"))
+    docs = [
+        ("Physics-9702/2023-May-June/qp/9702_s23_qp_12.pdf", "a" * 64),
+        ("Physics-9702/2023-May-June/ms/9702_s23_ms_12.pdf", "b" * 64),
+    ]
+    postings = {
+        "momentum": [(0, 0, 3), (1, 1, 1)],
+        "photon": [(0, 2, 1)],
+        "scheme": [(1, 0, 2)],
+    }
+    index._write(docs, postings)
+    yield index
+    index.close()
+
+
+def test_search_ranks_papers_containing_every_word(index):
+    hits = index.search("momentum", snippets=False)
+    assert [hit.path.rsplit("/", 1)[-1] for hit in hits] == ["9702_s23_qp_12.pdf", "9702_s23_ms_12.pdf"]
+    assert index.search("momentum photon", snippets=False)[0].pages == [1, 3]
+
+
+def test_search_prefix_and_filters(index):
+    assert len(index.search("mom*", snippets=False)) == 2
+    assert len(index.search("momentum", kind="ms", snippets=False)) == 1
+    assert index.search("momentum", subject="9709", snippets=False) == []
+
+
+def test_search_unknown_word_finds_nothing(index):
+    assert index.search("nosuchword", snippets=False) == []
+    assert index.search("momentum nosuchword", snippets=False) == []
+
+
+def test_search_words_in_different_papers_find_nothing(index):
+    assert index.search("photon scheme", snippets=False) == []
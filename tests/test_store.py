@@ -0,0 +1,63 @@
+import errno
+import hashlib
+import os
+
+import pytest
+
+from pastpaper import store as store_module
+from pastpaper.store import BlobStore, StoreError
+
+
+def add(store, tmp_path, body: bytes, name: str) -> str:
+    digest = hashlib.sha256(body).hexdigest()
+    part = tmp_path / f"{name}.part"
+    part.write_bytes(body)
+    store.commit(str(part), digest, str(tmp_path / "lib" / name))
+    return digest
+
+
+def test_prune_drops_only_unlinked_settled_blobs(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "lib"))
+    kept = add(store, tmp_path, b"%PDF kept", "kept.pdf")
+    dropped = add(store, tmp_path, b"%PDF dropped", "dropped.pdf")
+    os.remove(tmp_path / "lib" / "dropped.pdf")
+
+    # Just committed: a run might be about to link it
+    assert store.prune() == 0
+    assert store.has(dropped)
+
+    monkeypatch.setattr(store_module, "LEASE_TTL", -1)
+    assert store.prune() == 1
+    assert store.has(kept) and not store.has(dropped)
+
+
+def test_prune_refuses_without_hard_links(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "lib"))
+
+    def no_links(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", no_links)
+    with pytest.raises(StoreError):
+        store.prune()
+
+
+def test_commit_survives_a_blob_pruned_before_linking(tmp_path):
+    class RacingStore(BlobStore):
+        raced = False
+
+        def link(self, digest, out_path):
+            if not self.raced:
+                self.raced = True
+                os.remove(self.blob_path(digest))
+            super().link(digest, out_path)
+
+    store = RacingStore(str(tmp_path / "lib"))
+    body = b"%PDF same content"
+    add(BlobStore(str(tmp_path / "lib")), tmp_path, body, "first.pdf")
+    os.remove(tmp_path / "lib" / "first.pdf")
+
+    digest = add(store, tmp_path, body, "second.pdf")
+    assert store.has(digest)
+    assert (tmp_path / "lib" / "second.pdf").read_bytes() == body
+    assert not (tmp_path / "second.pdf.part").exists()